@@ -0,0 +1,343 @@
+# api_server.py
+import os
+import sys
+import json
+import asyncio
+import logging
+import argparse
+import tempfile
+import warnings
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+warnings.filterwarnings('ignore', category=UserWarning)
+
+from utils.model_utils import ModelManager
+from utils.file_processors import process_image, process_pdf
+from utils.astra_utils import store_in_astra, search_astra, content_hash, chunk_size_for
+from utils.tracing import trace
+from utils import uploads
+
+logger = logging.getLogger("chatbot.api")
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp"}
+
+def _json_error(status: int, message: str, **headers) -> web.Response:
+    return web.json_response({"error": message}, status=status, headers=headers or None)
+
+@web.middleware
+async def limit_concurrency(request: web.Request, handler: Callable) -> web.StreamResponse:
+    """Bound requests in flight; callers that wait too long get 503 with Retry-After"""
+    if request.path == "/health":
+        return await handler(request)
+
+    slots: asyncio.Semaphore = request.app["slots"]
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout=request.app["queue_timeout"])
+    except asyncio.TimeoutError:
+        return _json_error(503, "Server busy", **{"Retry-After": "1"})
+    try:
+        with trace(f"api:{request.path}"):
+            return await handler(request)
+    except web.HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Request to %s failed", request.path)
+        return _json_error(500, str(e))
+    finally:
+        slots.release()
+
+async def run_blocking(request: web.Request, func: Callable, *args) -> Any:
+    """Run CPU-bound or blocking work (OCR, embeddings) on the worker pool"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        request.app["cpu_pool"], context.run, func, *args
+    )
+
+async def read_json(request: web.Request) -> Dict[str, Any]:
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text=json.dumps({"error": "Body must be JSON"}),
+                                 content_type="application/json")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text=json.dumps({"error": "Body must be a JSON object"}),
+                                 content_type="application/json")
+    return body
+
+def check_model(request: web.Request, model_name: str):
+    if model_name not in request.app["model_manager"].MODELS:
+        raise web.HTTPBadRequest(text=json.dumps({"error": f"Unsupported model: {model_name}"}),
+                                 content_type="application/json")
+
+def read_k(body: Dict[str, Any], minimum: int) -> int:
+    """Number of search results requested, 3 by default"""
+    k = body.get("k", 3)
+    try:
+        if isinstance(k, bool) or int(k) != float(k):
+            raise ValueError
+        k = int(k)
+    except (TypeError, ValueError, OverflowError):
+        k = None
+    if k is None or k < minimum:
+        raise web.HTTPBadRequest(text=json.dumps({"error": f"'k' must be an integer of at least {minimum}"}),
+                                 content_type="application/json")
+    return k
+
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({
+        "status": "ok",
+        "vector_store": request.app["vector_store"] is not None,
+        "models": request.app["model_manager"].router.snapshot()
+    })
+
+async def ingest(request: web.Request) -> web.Response:
+    """Multipart upload: extract text, optionally analyze it, and store it"""
+    reader = await request.multipart()
+    fields: Dict[str, str] = {}
+    spool_path, filename = None, None
+
+    try:
+        async for part in reader:
+            if part.name != "file":
+                fields[part.name] = await part.text()
+                continue
+
+            # Stream the file to disk in chunks, enforcing the size limit as it arrives
+            filename = part.filename or "upload"
+            os.makedirs(uploads.SPOOL_DIR, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=uploads.SPOOL_DIR, delete=False,
+                                             suffix=os.path.splitext(filename)[1]) as spool:
+                spool_path = spool.name
+                size = 0
+                while chunk := await part.read_chunk(uploads.CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > uploads.MAX_FILE_BYTES:
+                        return _json_error(413, f"File exceeds {uploads.MAX_FILE_BYTES // 2 ** 20} MB")
+                    spool.write(chunk)
+
+        if spool_path is None:
+            return _json_error(400, "Missing 'file' field")
+
+        model_name = fields.get("model", request.app["default_model"])
+        analysis_type = fields.get("analysis_type", "general")
+        check_model(request, model_name)
+
+        extension = os.path.splitext(filename)[1].lower()
+        result: Dict[str, Any] = {"filename": filename}
+        if extension == ".pdf":
+            text = await run_blocking(request, lambda: process_pdf(spool_path, show_ui=False))
+            result["file_type"] = "pdf"
+        elif extension in IMAGE_EXTENSIONS:
+            text, confidence, stats = await run_blocking(
+                request,
+                lambda: process_image(spool_path, fields.get("enhancement_type", "default"), show_ui=False)
+            )
+            result.update({"file_type": "image", "confidence": confidence, "stats": stats})
+        else:
+            return _json_error(415, f"Unsupported file type: {extension or 'unknown'}")
+
+        if not text:
+            return web.json_response({**result, "error": "No text extracted"}, status=422)
+        result["text_chars"] = len(text)
+
+        model_manager: ModelManager = request.app["model_manager"]
+        if fields.get("analyze", "true").lower() != "false":
+            if model_manager.needs_map_reduce(text, model_name, analysis_type):
+                analysis = await model_manager.aanalyze_long_content(
+                    {"text": text}, model_name, analysis_type, use_memory=False
+                )
+            else:
+                analysis = await model_manager.aanalyze_content(
+                    {"text": text}, model_name, analysis_type, use_memory=False
+                )
+            if analysis is None:
+                # Extraction and storage still go ahead; the caller can retry /analyze
+                result["analysis_error"] = f"Analysis failed with {model_name} and its fallbacks"
+            else:
+                result["analysis"] = analysis
+
+        vector_store = request.app["vector_store"]
+        if vector_store is not None and fields.get("store", "true").lower() != "false":
+            metadata = {
+                "file_type": result["file_type"],
+                "filename": filename,
+                "model_used": model_name,
+                "analysis_type": analysis_type
+            }
+            if result["file_type"] == "image":
+                metadata.update({"confidence": result["confidence"], "stats": result["stats"]})
+            result["stored"] = await run_blocking(
+                request, store_in_astra, vector_store, text, metadata, chunk_size_for(result["file_type"])
+            )
+            result["content_hash"] = content_hash(text)
+        return web.json_response(result)
+    finally:
+        if spool_path:
+            try:
+                os.unlink(spool_path)
+            except FileNotFoundError:
+                pass
+
+async def search(request: web.Request) -> web.Response:
+    body = await read_json(request)
+    query = body.get("query")
+    if not query:
+        return _json_error(400, "Missing 'query'")
+    k = read_k(body, minimum=1)
+    if request.app["vector_store"] is None:
+        return _json_error(503, "Vector store unavailable")
+
+    results = await run_blocking(
+        request, search_astra, request.app["vector_store"], query, k
+    )
+    return web.json_response({
+        "results": [
+            {"id": doc.id, "content": doc.page_content, "metadata": doc.metadata}
+            for doc in results
+        ]
+    })
+
+async def analyze(request: web.Request) -> web.Response:
+    body = await read_json(request)
+    if not body.get("text"):
+        return _json_error(400, "Missing 'text'")
+    model_name = body.get("model", request.app["default_model"])
+    check_model(request, model_name)
+
+    analysis = await request.app["model_manager"].aanalyze_content(
+        {"text": body["text"]},
+        model_name,
+        body.get("analysis_type", "general"),
+        use_memory=False,
+        hedge=body.get("hedge")
+    )
+    if analysis is None:
+        return _json_error(502, f"Analysis failed with {model_name} and its fallbacks")
+    return web.json_response(analysis)
+
+async def chat(request: web.Request) -> web.StreamResponse:
+    """Answer a message with knowledge-base context, streamed as NDJSON lines"""
+    body = await read_json(request)
+    message = body.get("message")
+    if not message:
+        return _json_error(400, "Missing 'message'")
+    model_name = body.get("model", request.app["default_model"])
+    check_model(request, model_name)
+    k = read_k(body, minimum=0)
+
+    # Search for relevant context
+    prompt = message
+    vector_store = request.app["vector_store"]
+    if vector_store is not None and k > 0:
+        results = await run_blocking(request, search_astra, vector_store, message, k)
+        if results:
+            prompt = message + "\nRelevant context:\n" + "\n".join(doc.page_content for doc in results)
+
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+
+    stats: Dict[str, Any] = {}
+    try:
+        async for chunk in request.app["model_manager"].astream_content(
+            {"text": prompt}, model_name, body.get("analysis_type", "general"),
+            use_memory=False, stats=stats
+        ):
+            await response.write((json.dumps({"chunk": chunk}) + "\n").encode())
+        await response.write((json.dumps({"done": True, "stats": stats}) + "\n").encode())
+    except Exception as e:
+        # Headers are already sent, so the error goes into the stream
+        await response.write((json.dumps({"error": str(e)}) + "\n").encode())
+    await response.write_eof()
+    return response
+
+def create_app(model_manager: ModelManager,
+               vector_store: Optional[Any],
+               max_concurrency: int = 64,
+               queue_timeout: float = 10.0,
+               cpu_workers: int = os.cpu_count() or 1,
+               default_model: str = "llama-3.3-70b-versatile") -> web.Application:
+    """Build the API application around existing model and vector store clients"""
+    app = web.Application(middlewares=[limit_concurrency], client_max_size=uploads.MAX_FILE_BYTES)
+    app["model_manager"] = model_manager
+    app["vector_store"] = vector_store
+    app["default_model"] = default_model
+    app["queue_timeout"] = queue_timeout
+    app["slots"] = asyncio.Semaphore(max_concurrency)
+    app["cpu_pool"] = ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="api-cpu")
+
+    async def shutdown_pool(app: web.Application):
+        app["cpu_pool"].shutdown(wait=False)
+    app.on_cleanup.append(shutdown_pool)
+
+    app.router.add_get("/health", health)
+    app.router.add_post("/ingest", ingest)
+    app.router.add_post("/search", search)
+    app.router.add_post("/analyze", analyze)
+    app.router.add_post("/chat", chat)
+    return app
+
+def create_fake_backends(latency: float = 0.2):
+    """Fake Groq/Gemini providers and an in-memory vector store, for local testing"""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_core.vectorstores import InMemoryVectorStore
+    from utils.fake_providers import FakeLLMServer, FakeLatency, FakeGenAI
+
+    server = FakeLLMServer(FakeLatency(latency=latency)).start()
+    server.install()
+    model_manager = ModelManager()
+    model_manager.clients["google"] = FakeGenAI(FakeLatency(latency=latency))
+    vector_store = InMemoryVectorStore(DeterministicFakeEmbedding(size=384))
+    return model_manager, vector_store, server
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HTTP API for ingestion, search, analysis and chat")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-concurrency", type=int, default=64,
+                        help="Requests handled at once; others queue")
+    parser.add_argument("--queue-timeout", type=float, default=10.0,
+                        help="Seconds a request may queue before a 503")
+    parser.add_argument("--cpu-workers", type=int, default=os.cpu_count() or 1,
+                        help="Threads for OCR, PDF extraction and embeddings")
+    parser.add_argument("--keepalive-timeout", type=float, default=75.0,
+                        help="Seconds idle keep-alive connections are held open")
+    parser.add_argument("--fake", action="store_true",
+                        help="Use fake LLM providers and an in-memory vector store")
+    parser.add_argument("--fake-latency", type=float, default=0.2)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    # Streamlit calls inside the utils are no-ops here; silence their warnings
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    if args.fake:
+        model_manager, vector_store, _ = create_fake_backends(args.fake_latency)
+    else:
+        from utils.astra_utils import initialize_embeddings, initialize_astra
+        model_manager = ModelManager()
+        embeddings = initialize_embeddings()
+        vector_store = initialize_astra(embeddings) if embeddings else None
+        if vector_store is None:
+            logger.warning("AstraDB unavailable; /search and storage are disabled")
+
+    app = create_app(
+        model_manager,
+        vector_store,
+        max_concurrency=args.max_concurrency,
+        queue_timeout=args.queue_timeout,
+        cpu_workers=args.cpu_workers
+    )
+    web.run_app(app, host=args.host, port=args.port, keepalive_timeout=args.keepalive_timeout)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
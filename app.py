@@ -25,15 +25,22 @@ from utils.file_processors import (
     process_image, 
     process_pdf, 
     process_video,
-    process_batch_images
+    process_batch_images,
+    make_preview
 )
 from utils.model_utils import ModelManager, BatchProcessor
 from utils.astra_utils import (
     initialize_embeddings,
     initialize_astra,
     store_in_astra,
-    search_astra
+    search_astra,
+    chunk_size_for
 )
+from utils.job_queue import JobQueue, save_upload, start_workers
+from utils.tracing import trace, render_debug_panel, start_metrics_server
+from utils.pipeline import StagePipeline
+from utils.memory import MemoryMonitor, record_session_state, render_memory_panel, is_memory_admin
+from utils import results_store
 
 # Suppress warnings
 warnings.filterwarnings('ignore', category=UserWarning)
@@ -80,15 +87,336 @@ def initialize_system():
     
     return model_manager, batch_processor, vector_store
 
+@st.cache_resource
+def initialize_metrics_exporter():
+    """Serve Prometheus metrics once per server process when METRICS_PORT is set"""
+    if os.getenv("METRICS_PORT"):
+        return start_metrics_server(int(os.getenv("METRICS_PORT")))
+    return None
+
+@st.cache_resource
+def initialize_job_queue():
+    """Open the background job queue and start its worker processes once per server"""
+    job_queue = JobQueue()
+    job_queue.requeue_stale()
+    start_workers(int(os.getenv("JOB_WORKERS", "2")))
+    return job_queue
+
+def submit_background_job(job_queue, file, model_name, analysis_type, enhancement_type) -> str:
+    """Spool an upload to disk and queue it for the worker processes"""
+    if 'pdf' in file.type:
+        kind = "pdf"
+    elif 'video' in file.type:
+        kind = "video"
+    else:
+        kind = "image"
+    
+    return job_queue.submit(kind, {
+        "path": save_upload(file),
+        "filename": file.name,
+        "enhancement_type": enhancement_type,
+        "model_name": model_name,
+        "analysis_type": analysis_type,
+        "store": kind != "video",
+        "cleanup": True
+    })
+
+@st.fragment(run_every=2)
+def render_job_panel(job_queue):
+    """Poll and display the status of this session's background jobs"""
+    jobs = job_queue.list_jobs(st.session_state.job_ids)
+    if not jobs:
+        return
+    
+    st.subheader("Background Jobs")
+    for job in jobs:
+        # A running job stops at its next checkpoint; until then it is only requested
+        status = "cancel requested" if job['status'] == 'running' and job['cancel_requested'] else job['status']
+        with st.expander(f"{job['payload']['filename']} — {status}",
+                         expanded=job['status'] == 'running'):
+            if job['status'] in ('queued', 'running'):
+                st.progress(job['progress'])
+                if job['cancel_requested']:
+                    st.caption("Stopping after the current step…")
+                elif st.button("Cancel", key=f"cancel_{job['id']}"):
+                    job_queue.cancel(job['id'])
+            elif job['status'] == 'succeeded':
+                result = job['result'] or {}
+                if 'analysis' in result:
+                    st.write(result['analysis'])
+                st.json(result, expanded=False)
+            elif job['error']:
+                st.error(job['error'])
+
+def batch_result_record(result, ocr, analysis_type) -> dict:
+    """Join one file's OCR output and analysis result into a results row"""
+    return {
+        **result,
+        'filename': result['content_id'],
+        'file_type': 'image',
+        'analysis_type': analysis_type,
+        'confidence': ocr.get('confidence'),
+        'stats': ocr.get('stats'),
+        'ocr_s': ocr.get('ocr_s'),
+        'analyze_s': result.get('latency_s'),
+        'total_s': (ocr.get('ocr_s') or 0) + (result.get('latency_s') or 0)
+    }
+
+def render_batch_results(path: str, page_size: int = 25):
+    """Paginated table of a batch results file with aggregate views"""
+    total = results_store.count_rows(path)
+    summary = results_store.summarize(path)
+    
+    st.subheader("Batch Results")
+    cols = st.columns(4)
+    cols[0].metric("Files", summary['rows'])
+    cols[1].metric("Succeeded", summary['succeeded'])
+    cols[2].metric("Mean confidence", f"{summary.get('confidence_mean', 0):.1f}%")
+    cols[3].metric("p95 latency", f"{summary.get('total_s_p95', 0):.2f}s")
+    
+    pages = max(1, -(-total // page_size))
+    page = st.number_input("Page", min_value=1, max_value=pages, value=1, key="batch_results_page") - 1
+    table = results_store.read_page(path, page, page_size, columns=results_store.SUMMARY_COLUMNS)
+    st.dataframe(table.to_pylist(), hide_index=True, use_container_width=True)
+    
+    # Analysis text is only read for the row being looked at
+    row = st.selectbox(
+        "Show analysis for",
+        range(page * page_size, page * page_size + table.num_rows),
+        format_func=lambda index: table['filename'][index - page * page_size].as_py() or str(index)
+    )
+    if row is not None:
+        with st.expander("Analysis", expanded=True):
+            record = results_store.read_row(path, row)
+            if record.get('analysis'):
+                st.write(record['analysis'])
+            elif record.get('error'):
+                st.error(record['error'])
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.caption("OCR confidence distribution")
+        distribution = results_store.confidence_distribution(path)
+        if distribution:
+            st.bar_chart(distribution)
+    with col2:
+        st.caption("Failures per model")
+        failures = results_store.failures_per_model(path)
+        if failures:
+            st.dataframe(failures, hide_index=True, use_container_width=True)
+        else:
+            st.write("No failures")
+    
+    with open(path, "rb") as results_file:
+        st.download_button("Download results (Parquet)", results_file,
+                           file_name=os.path.basename(path))
+
+def render_comparison(model_manager, content, model_names, analysis_type) -> dict:
+    """Stream one analysis from several models into side-by-side columns"""
+    columns = dict(zip(model_names, st.columns(len(model_names))))
+    placeholders, texts = {}, {}
+    for name, column in columns.items():
+        column.markdown(f"**{name}**")
+        placeholders[name] = column.empty()
+        texts[name] = ""
+    
+    # Chunks arrive interleaved as each model produces them
+    stats = {}
+    for name, chunk in model_manager.stream_compare(content, model_names, analysis_type, stats):
+        texts[name] += chunk
+        placeholders[name].markdown(texts[name])
+    
+    for name, column in columns.items():
+        model_stats = stats.get(name, {})
+        if model_stats.get('status') != 'success':
+            placeholders[name].error(model_stats.get('error', 'No answer'))
+            continue
+        # An empty stream succeeds without a first chunk
+        first_chunk_s = model_stats.get('first_chunk_s')
+        column.caption(
+            f"{model_stats['total_s']:.2f}s total · "
+            f"first chunk {f'{first_chunk_s:.2f}s' if first_chunk_s is not None else 'n/a'} · "
+            f"{model_stats.get('input_tokens', '?')} in / {model_stats.get('output_tokens', '?')} out tokens"
+        )
+    
+    results_store.write_comparison(stats, analysis_type, len(content.get('text', '')))
+    with st.expander("Comparison history (all runs)"):
+        st.dataframe(results_store.comparison_summary(), hide_index=True, use_container_width=True)
+    return stats
+
+def store_upload(vector_store, text, metadata, slot):
+    """Store extracted text, reporting the outcome in ``slot``"""
+    with slot:
+        stored = store_in_astra(vector_store, text, metadata,
+                                chunk_size=chunk_size_for(metadata["file_type"]))
+        if stored:
+            st.success("Results stored successfully!")
+    return metadata if stored else None
+
+def record_served_model(vector_store, text, stored, analysis):
+    """Correct ``model_used`` once the analysis is in; known content only updates metadata"""
+    if stored and analysis and analysis.get('model') and analysis['model'] != stored['model_used']:
+        store_in_astra(vector_store, text, {**stored, "model_used": analysis['model']},
+                       chunk_size=chunk_size_for(stored["file_type"]))
+
+def render_stage_timings(pipeline: StagePipeline):
+    with st.expander("Stage timings"):
+        st.caption(
+            f"Finished in {pipeline.wall_s:.2f}s; "
+            f"run one after another the stages take {pipeline.sequential_s():.2f}s"
+        )
+        st.dataframe(pipeline.timing_rows(), hide_index=True, use_container_width=True)
+
+def run_image_pipeline(file, model_manager, vector_store, model, analysis_type,
+                       enhancement_type, compare_models=None, hedge=None) -> StagePipeline:
+    """OCR an image, then analyze and store its text concurrently"""
+    # One container per stage keeps the page order fixed whichever stage finishes first
+    ocr_slot, analysis_slot, store_slot = st.container(), st.container(), st.container()
+    
+    def ocr():
+        with ocr_slot:
+            text, confidence, stats = process_image(file, enhancement_type)
+        return (text, confidence, stats) if text else None
+    
+    def analyze(ocr_result):
+        text = ocr_result[0]
+        with analysis_slot:
+            if compare_models:
+                # Same content to every selected model, side by side
+                st.subheader("Model Comparison")
+                file.seek(0)
+                compare_stats = render_comparison(
+                    model_manager,
+                    {'image': Image.open(file), 'text': text},
+                    compare_models,
+                    analysis_type
+                )
+                answered = [name for name, s in compare_stats.items() if s.get('status') == 'success']
+                return {'model': ", ".join(answered)} if answered else None
+            
+            content = {'text': text}
+            # Use Gemini Pro for image analysis if selected, Groq for text analysis otherwise
+            if model == "gemini-pro":
+                file.seek(0)
+                content['image'] = Image.open(file)
+            analysis = model_manager.analyze_content(content, model, analysis_type, hedge=hedge)
+            
+            if analysis:
+                # Display results
+                st.subheader("Analysis Results")
+                st.write(analysis['analysis'])
+            return analysis
+    
+    def store(ocr_result):
+        text, confidence, stats = ocr_result
+        metadata = {
+            "file_type": "image",
+            "filename": file.name,
+            "confidence": confidence,
+            "stats": stats,
+            "model_used": ", ".join(compare_models) if compare_models else model,
+            "analysis_type": analysis_type
+        }
+        return store_upload(vector_store, text, metadata, store_slot)
+    
+    # Storage needs only the OCR text, so it does not wait for the analysis
+    pipeline = StagePipeline().add("ocr", ocr).add("analyze", analyze, after=("ocr",))
+    if vector_store is not None:
+        pipeline.add("store", store, after=("ocr",))
+    results = pipeline.run()
+    
+    if results.get("ocr"):
+        record_served_model(vector_store, results["ocr"][0], results.get("store"), results.get("analyze"))
+    return pipeline
+
+def run_pdf_pipeline(file, model_manager, vector_store, model, analysis_type,
+                     compare_models=None, hedge=None) -> StagePipeline:
+    """Extract a PDF's text, then analyze and store it concurrently"""
+    extract_slot, analysis_slot, store_slot = st.container(), st.container(), st.container()
+    
+    def extract():
+        with extract_slot:
+            return process_pdf(file)
+    
+    def analyze(text):
+        with analysis_slot:
+            long_document = any(
+                model_manager.needs_map_reduce(text, name, analysis_type)
+                for name in (compare_models or [model])
+            )
+            if compare_models and long_document:
+                st.info("Document exceeds a model context; analyzing with the selected model only")
+            
+            if compare_models and not long_document:
+                st.subheader("Model Comparison")
+                render_comparison(model_manager, {'text': text}, compare_models, analysis_type)
+                return None
+            # Analyze with selected model, in parts if it exceeds the context
+            if model_manager.needs_map_reduce(text, model, analysis_type):
+                with st.spinner("Document exceeds the model context; analyzing in parts..."):
+                    analysis = model_manager.analyze_long_content(
+                        {'text': text},
+                        model,
+                        analysis_type,
+                        use_memory=False,
+                        hedge=hedge
+                    )
+            else:
+                # Documents are analyzed on their own; chat history would eat into the context
+                analysis = model_manager.analyze_content(
+                    {'text': text},
+                    model,
+                    analysis_type,
+                    use_memory=False,
+                    hedge=hedge
+                )
+            
+            if analysis:
+                st.subheader("Analysis Results")
+                if analysis.get('chunks'):
+                    st.caption(f"Analyzed in {analysis['chunks']} parts and merged")
+                st.write(analysis['analysis'])
+            return analysis
+    
+    def store(text):
+        metadata = {
+            "file_type": "pdf",
+            "filename": file.name,
+            "model_used": model,
+            "analysis_type": analysis_type
+        }
+        return store_upload(vector_store, text, metadata, store_slot)
+    
+    pipeline = StagePipeline().add("extract", extract).add("analyze", analyze, after=("extract",))
+    if vector_store is not None:
+        pipeline.add("store", store, after=("extract",))
+    results = pipeline.run()
+    
+    if results.get("extract"):
+        record_served_model(vector_store, results["extract"], results.get("store"), results.get("analyze"))
+    return pipeline
+
 # Session state initialization
 
 if 'messages' not in st.session_state:
     st.session_state.messages = []
 if 'batch_results' not in st.session_state:
-    st.session_state.batch_results = []
+    # Uploads of the last batch and the Parquet file holding its results
+    st.session_state.batch_results = None
+if 'job_ids' not in st.session_state:
+    # Job ids live in the URL too, so a browser refresh can pick them back up
+    st.session_state.job_ids = [
+        job_id for job_id in st.query_params.get("jobs", "").split(",") if job_id
+    ]
+if 'submitted_uploads' not in st.session_state:
+    st.session_state.submitted_uploads = set()
+if 'last_trace' not in st.session_state:
+    st.session_state.last_trace = None
 
 # Initialize system components
 model_manager, batch_processor, vector_store = initialize_system()
+initialize_metrics_exporter()
+memory_monitor = MemoryMonitor.shared()
 
 # Sidebar UI
 with st.sidebar:
@@ -108,8 +436,27 @@ with st.sidebar:
         Model Details:
         - Provider: {config.provider}
         - Vision Support: {'Yes' if config.supports_vision else 'No'}
+        - Fallbacks: {', '.join(config.fallbacks) or 'None'}
         """)
     
+    hedge_requests = st.checkbox(
+        "Hedge slow requests",
+        value=model_manager.router.hedge,
+        help="Also ask a fallback model when the selected one is slower than its usual p95"
+    )
+    
+    # Fan the same upload out to several models
+    compare_mode = st.checkbox(
+        "Compare models",
+        help="Stream the same upload from several models side by side"
+    )
+    if compare_mode:
+        compare_models = st.multiselect(
+            "Models to compare",
+            list(model_manager.MODELS.keys()),
+            default=list(model_manager.MODELS.keys())
+        )
+    
     # Analysis type selection
     analysis_type = st.selectbox(
         "Analysis Type",
@@ -136,6 +483,13 @@ with st.sidebar:
             value=5
         )
     
+    # Background processing settings
+    st.subheader("Background Jobs")
+    run_in_background = st.checkbox(
+        "Run uploads in background",
+        help="Queue uploads for worker processes instead of processing them in this page"
+    )
+    
     # Database connection test
     if st.button("Test Database Connection"):
         if vector_store:
@@ -144,6 +498,10 @@ with st.sidebar:
                 st.success("Database connection successful!")
             except Exception as e:
                 st.error(f"Database connection failed: {str(e)}")
+    
+    # Latency breakdown of the last request, filled in at the end of the run
+    show_debug = st.checkbox("Show debug panel")
+    debug_panel = st.empty()
 
 # Main interface
 st.title("🤖 Multi-Modal Chatbot")
@@ -155,7 +513,21 @@ uploaded_files = st.file_uploader(
     accept_multiple_files=enable_batch
 )
 
-if uploaded_files:
+if uploaded_files and run_in_background:
+    job_queue = initialize_job_queue()
+    files = uploaded_files if isinstance(uploaded_files, list) else [uploaded_files]
+    
+    # Streamlit reruns the script with the same uploads, so only submit new ones
+    for file in files:
+        if file.file_id in st.session_state.submitted_uploads:
+            continue
+        st.session_state.job_ids.append(submit_background_job(
+            job_queue, file, model, analysis_type, enhancement_type
+        ))
+        st.session_state.submitted_uploads.add(file.file_id)
+    st.query_params["jobs"] = ",".join(st.session_state.job_ids)
+
+elif uploaded_files:
     # Handle batch or single file processing
     if enable_batch and isinstance(uploaded_files, list):
         st.subheader("Batch Processing")
@@ -166,107 +538,99 @@ if uploaded_files:
             if 'image' in file.type:
                 batch_data.append({
                     'name': file.name,
-                    'image': Image.open(file),
+                    'image': file,
                     'enhancement_type': enhancement_type
                 })
         
-        if batch_data:
+        batch_key = [file.file_id for file in uploaded_files]
+        last_batch = st.session_state.batch_results
+        if batch_data and (last_batch is None or last_batch['uploads'] != batch_key):
             # Process batch
-            with st.spinner('Processing batch...'):
-                results = process_batch_images(batch_data)
+            with trace("batch") as request_trace:
+                with st.spinner('Processing batch...'):
+                    results = process_batch_images(batch_data)
+                    ocr_by_name = {r['filename']: r for r in results}
+                    results_path = results_store.new_results_path()
                 
-                # Analyze results with selected model
-                analyzed_results = batch_processor.process_batch(
-                    [{'text': r['text'], 'id': r['filename']} 
-                     for r in results if 'text' in r],
-                    model,
-                    analysis_type
-                )
-                
-                # Store results
-                st.session_state.batch_results = analyzed_results
+                    with results_store.BatchResultWriter(results_path) as writer:
+                        # Files that failed OCR or had no text never reach the model
+                        for r in results:
+                            if 'error' in r:
+                                writer.write({**r, 'content_id': r['filename'], 'status': 'ocr_error',
+                                              'file_type': 'image', 'model': model,
+                                              'analysis_type': analysis_type, 'total_s': r['ocr_s']})
+                            elif not r.get('text'):
+                                writer.write({**r, 'content_id': r['filename'], 'status': 'ocr_no_text',
+                                              'error': (r.get('stats') or {}).get('error', 'No text extracted'),
+                                              'file_type': 'image', 'model': model,
+                                              'analysis_type': analysis_type, 'total_s': r['ocr_s']})
+                    
+                        # Analyze results with selected model, appending each as it finishes
+                        batch_processor.process_batch(
+                            [{'text': r['text'], 'id': r['filename']} 
+                             for r in results if r.get('text')],
+                            model,
+                            analysis_type,
+                            on_result=lambda result: writer.write(batch_result_record(
+                                result, ocr_by_name.get(result['content_id'], {}), analysis_type
+                            ))
+                        )
                 
-                # Display results
-                st.subheader("Batch Results")
-                for result in analyzed_results:
-                    with st.expander(f"Result: {result['content_id']}"):
-                        st.json(result)
+                    # Keep only the file path; reruns page through it instead
+                    st.session_state.batch_results = {'uploads': batch_key, 'path': results_path}
+            st.session_state.last_trace = request_trace
+        
+        if st.session_state.batch_results:
+            render_batch_results(st.session_state.batch_results['path'])
     
     else:
         # Single file processing
         file = uploaded_files if not isinstance(uploaded_files, list) else uploaded_files[0]
         
-        try:
-            file_type = file.type
-            st.info(f"Processing {file.name}...")
+        with trace(f"upload:{file.type}") as request_trace:
+            try:
+                file_type = file.type
+                st.info(f"Processing {file.name}...")
             
-            if 'image' in file_type:
-                # Process image
-                image = Image.open(file)
-                st.image(image, caption='Uploaded Image')
-                
-                text, confidence, stats = process_image(
-                    image,
-                    enhancement_type
-                )
+                if 'image' in file_type:
+                    # Show a downscaled preview; OCR decodes the upload itself
+                    st.image(make_preview(file), caption='Uploaded Image')
                 
-                if text:
-                    # Use Gemini Pro for image analysis if selected
-                    if model == "gemini-pro":
-                        analysis = model_manager.analyze_content(
-                            {'image': image, 'text': text},
-                            model,
-                            analysis_type
-                        )
-                    else:
-                        # Use Groq for text analysis
-                        analysis = model_manager.analyze_content(
-                            {'text': text},
-                            model,
-                            analysis_type
-                        )
-                    
-                    if analysis:
-                        # Display results
-                        st.subheader("Analysis Results")
-                        st.write(analysis['analysis'])
-                        
-                        # Store in AstraDB
-                        metadata = {
-                            "file_type": "image",
-                            "filename": file.name,
-                            "confidence": confidence,
-                            "stats": stats,
-                            "model_used": model,
-                            "analysis_type": analysis_type
-                        }
-                        
-                        if store_in_astra(vector_store, text, metadata):
-                            st.success("Results stored successfully!")
+                    pipeline = run_image_pipeline(
+                        file,
+                        model_manager,
+                        vector_store,
+                        model,
+                        analysis_type,
+                        enhancement_type,
+                        compare_models=compare_models if compare_mode else None,
+                        hedge=hedge_requests
+                    )
+                    render_stage_timings(pipeline)
                 
-            elif 'pdf' in file_type:
-                text = process_pdf(file)
-                if text:
-                    st.success("PDF processed successfully!")
-                    
-                    # Analyze with selected model
-                    analysis = model_manager.analyze_content(
-                        {'text': text},
+                elif 'pdf' in file_type:
+                    pipeline = run_pdf_pipeline(
+                        file,
+                        model_manager,
+                        vector_store,
                         model,
-                        analysis_type
+                        analysis_type,
+                        compare_models=compare_models if compare_mode else None,
+                        hedge=hedge_requests
                     )
-                    
-                    if analysis:
-                        st.subheader("Analysis Results")
-                        st.write(analysis['analysis'])
+                    render_stage_timings(pipeline)
             
-            elif 'video' in file_type:
-                result = process_video(file)
-                if result:
-                    st.success(result)
+                elif 'video' in file_type:
+                    result = process_video(file)
+                    if result:
+                        st.success(result)
             
-        except Exception as e:
-            st.error(f"Error processing file: {str(e)}")
+            except Exception as e:
+                st.error(f"Error processing file: {str(e)}")
+        st.session_state.last_trace = request_trace
+
+if st.session_state.job_ids:
+    render_job_panel(initialize_job_queue())
 
 # Chat interface
 st.subheader("Chat Interface")
@@ -283,33 +647,51 @@ if prompt := st.chat_input("Ask me anything..."):
     # Generate response
     with st.chat_message("assistant"):
         with st.spinner("Thinking..."):
-            try:
-                # Search for relevant context
-                additional_context = ""
-                if vector_store:
-                    with st.spinner("Searching knowledge base..."):
-                        search_results = search_astra(vector_store, prompt, k=3)
-                        if search_results:
-                            additional_context = "\nRelevant context:\n" + \
-                                "\n".join([doc.page_content for doc in search_results])
-                
-                # Generate response
-                response = model_manager.analyze_content(
-                    {
-                        'text': prompt + additional_context if additional_context else prompt
-                    },
-                    model,
-                    analysis_type
-                )
+            with trace("chat") as request_trace:
+                try:
+                    # Search for relevant context
+                    additional_context = ""
+                    if vector_store:
+                        with st.spinner("Searching knowledge base..."):
+                            search_results = search_astra(vector_store, prompt, k=3)
+                            if search_results:
+                                additional_context = "\nRelevant context:\n" + \
+                                    "\n".join([doc.page_content for doc in search_results])
                 
-                if response:
-                    st.markdown(response['analysis'])
-                    st.session_state.messages.append(
-                        {"role": "assistant", "content": response['analysis']}
+                    # Generate response
+                    response = model_manager.analyze_content(
+                        {
+                            'text': prompt + additional_context if additional_context else prompt
+                        },
+                        model,
+                        analysis_type,
+                        hedge=hedge_requests
                     )
                 
-            except Exception as e:
-                st.error(f"Error generating response: {str(e)}")
+                    if response:
+                        st.markdown(response['analysis'])
+                        if response['model'] != model:
+                            st.caption(f"Answered by {response['model']} ({model} unavailable)")
+                        st.session_state.messages.append(
+                            {"role": "assistant", "content": response['analysis']}
+                        )
+                
+                except Exception as e:
+                    st.error(f"Error generating response: {str(e)}")
+            st.session_state.last_trace = request_trace
+
+# Account this session's state (throttled), for the memory panel of an admin session
+memory_admin = is_memory_admin()
+state_sizes = record_session_state(memory_monitor, force=show_debug and memory_admin)
+
+if show_debug:
+    with debug_panel.container():
+        render_debug_panel(st.session_state.last_trace)
+        with st.expander("Debug: model health"):
+            st.json(model_manager.router.snapshot())
+        # Other sessions' sizes and process-wide tracing are for admins only
+        if memory_admin:
+            render_memory_panel(memory_monitor, state_sizes)
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,117 @@
+# batch_cli.py
+import os
+import sys
+import json
+import logging
+import argparse
+import warnings
+
+from dotenv import load_dotenv
+
+warnings.filterwarnings('ignore', category=UserWarning)
+
+from utils.model_utils import ModelManager
+from utils.astra_utils import initialize_embeddings, initialize_astra
+from utils.batch_runner import BatchRunner, collect_inputs
+from utils.results_store import ResultDatasetWriter, dataset_parts, read_dataset
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Run OCR/PDF extraction, analysis and storage without the Streamlit UI"
+    )
+    parser.add_argument("source", help="Directory to scan or manifest file (one path per line or JSONL)")
+    parser.add_argument("--model", default="llama-3.3-70b-versatile",
+                        choices=list(ModelManager.MODELS.keys()))
+    parser.add_argument("--analysis-type", default="general",
+                        choices=["general", "technical", "educational"])
+    parser.add_argument("--enhancement-type", default="default",
+                        choices=["default", "document", "handwriting"])
+    parser.add_argument("--extract-workers", type=int, default=os.cpu_count() or 1,
+                        help="Parallel OCR/PDF extraction workers")
+    parser.add_argument("--analyze-workers", type=int, default=4,
+                        help="Parallel analysis/storage workers")
+    parser.add_argument("--checkpoint", default="batch_checkpoint.jsonl",
+                        help="JSONL checkpoint file; finished items are skipped on resume. "
+                             "Resume it together with the same --results directory")
+    parser.add_argument("--summary", default="batch_summary.json",
+                        help="Where to write the throughput/latency summary")
+    parser.add_argument("--results", default=None,
+                        help="Directory of Parquet part files to append per-file results to as they finish")
+    parser.add_argument("--overwrite-results", action="store_true",
+                        help="Delete results already in --results when starting without a checkpoint")
+    parser.add_argument("--no-store", action="store_true",
+                        help="Skip storing results in AstraDB")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    load_dotenv()
+
+    # Streamlit calls inside the utils are no-ops here; silence their warnings
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    paths = collect_inputs(args.source)
+    print(f"Found {len(paths)} files in {args.source}")
+
+    vector_store = None
+    if not args.no_store:
+        embeddings = initialize_embeddings()
+        vector_store = initialize_astra(embeddings) if embeddings else None
+        if vector_store is None:
+            print("❌ Could not initialize AstraDB; rerun with --no-store to skip storage")
+            return 1
+
+    runner = BatchRunner(
+        ModelManager(),
+        vector_store,
+        args.model,
+        analysis_type=args.analysis_type,
+        enhancement_type=args.enhancement_type,
+        extract_workers=args.extract_workers,
+        analyze_workers=args.analyze_workers,
+        checkpoint_path=args.checkpoint
+    )
+
+    writer = None
+    if args.results:
+        parts = dataset_parts(args.results)
+        if parts and not os.path.exists(args.checkpoint):
+            # Results without their checkpoint would mix two unrelated runs
+            if not args.overwrite_results:
+                print(f"❌ {args.results} already holds results but {args.checkpoint} does not exist; "
+                      "pass --overwrite-results to replace them")
+                return 1
+            for part in parts:
+                os.unlink(part)
+        # Items checkpointed whose results never reached disk (the run was
+        # killed before they were flushed) are processed again
+        recorded = set(read_dataset(args.results, columns=["content_id"])["content_id"].to_pylist())
+        runner.checkpoint.completed &= recorded
+        writer = ResultDatasetWriter(args.results)
+
+    def report(result):
+        icon = "✅" if result["status"] == "success" else "❌"
+        print(f"{icon} {result['filename']}: {result.get('error', result['status'])}")
+        if writer:
+            writer.write({
+                **result,
+                "content_id": result["id"],
+                "analysis_type": args.analysis_type,
+                "enhancement_type": args.enhancement_type,
+                "ocr_s": result.get("extract_s")
+            })
+
+    try:
+        summary = runner.run(paths, on_result=report)
+    finally:
+        if writer:
+            writer.close()
+
+    with open(args.summary, "w", encoding="utf-8") as summary_file:
+        json.dump(summary, summary_file, indent=2)
+
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,499 @@
+# benchmark.py
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import warnings
+import statistics
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, Any, List
+
+warnings.filterwarnings('ignore', category=UserWarning)
+
+import cv2
+import numpy as np
+
+from utils.fake_providers import FakeLLMServer, FakeLatency
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+GROQ_BENCH_MODEL = "llama-3.3-70b-versatile"
+
+SAMPLE_TEXT = (
+    "The quarterly report shows revenue growth of 12 percent driven by cloud "
+    "services. Operating margin improved while headcount remained flat. "
+)
+
+def make_text_image(width: int = 1600, height: int = 1200, lines: int = 30) -> np.ndarray:
+    """Generate a BGR page of printed text with mild noise"""
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    for line in range(lines):
+        cv2.putText(
+            image, f"Line {line}: {SAMPLE_TEXT[:60]}", (40, 60 + line * 36),
+            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2
+        )
+    noise = np.random.default_rng(0).integers(0, 40, image.shape, dtype=np.uint8)
+    return cv2.subtract(image, noise)
+
+def make_pdf(pages: int = 20, lines_per_page: int = 40) -> bytes:
+    """Build a minimal multi-page text PDF without any PDF writer dependency"""
+    objects = []
+    page_ids = []
+    font_id = 3 + 2 * pages
+    for page in range(pages):
+        content_lines = ["BT", "/F1 10 Tf", "40 800 Td", "12 TL"]
+        for line in range(lines_per_page):
+            content_lines.append(f"(Page {page} line {line}: {SAMPLE_TEXT[:70]}) '")
+        content_lines.append("ET")
+        stream = "\n".join(content_lines).encode()
+        page_id, content_id = 3 + 2 * page, 4 + 2 * page
+        page_ids.append(page_id)
+        objects.append((page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode()))
+        objects.append((content_id, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects.insert(0, (2, f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode()))
+    objects.insert(0, (1, b"<< /Type /Catalog /Pages 2 0 R >>"))
+    objects.append((font_id, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"))
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id, body in sorted(objects):
+        offsets[object_id] = output.tell()
+        output.write(b"%d 0 obj\n" % object_id + body + b"\nendobj\n")
+    xref_offset = output.tell()
+    output.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for object_id in sorted(offsets):
+        output.write(b"%010d 00000 n \n" % offsets[object_id])
+    output.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset))
+    return output.getvalue()
+
+def measure(func: Callable[[], Any], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """Time ``func`` and summarize the samples in seconds"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {
+        "n": repeat,
+        "mean_s": statistics.fmean(samples),
+        "p50_s": samples[len(samples) // 2],
+        "p95_s": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "min_s": samples[0]
+    }
+
+def _image_pipeline(variant: str, encoded: bytes) -> int:
+    """Decode, enhance and preview one upload; returns the preview bytes sent
+
+    ``before`` is the original path: a full RGB decode, a BGR copy, and
+    full-size frames sent as previews. ``after`` is the current one.
+    """
+    from PIL import Image
+    from utils.file_processors import enhance_image, load_image_gray, make_preview
+
+    upload = io.BytesIO(encoded)
+    if variant == "before":
+        cv_image = cv2.cvtColor(np.array(Image.open(upload)), cv2.COLOR_RGB2BGR)
+        processed = enhance_image(cv_image, "handwriting")
+        previews = [cv_image, processed]
+    else:
+        processed = enhance_image(load_image_gray(upload), "handwriting")
+        previews = [make_preview(upload), make_preview(processed)]
+    return sum(preview.nbytes for preview in previews)
+
+def bench_images(results: Dict[str, Any], args: argparse.Namespace):
+    from utils.file_processors import enhance_image, process_image
+
+    repeat = args.repeat
+    image = make_text_image()
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    for mode in ("default", "document", "handwriting"):
+        results[f"enhance_image[{mode}]"] = measure(lambda: enhance_image(gray, mode), repeat)
+
+    # Peak memory and preview payload for a 12 MP photo, before and after grayscale
+    # decoding. Arrays are allocated through numpy, so tracemalloc sees every frame.
+    photo = cv2.imencode(".jpg", make_text_image(4000, 3000, 80))[1].tobytes()
+    for variant in ("before", "after"):
+        stats = measure(lambda: _image_pipeline(variant, photo), repeat)
+        tracemalloc.start()
+        try:
+            payload_bytes = _image_pipeline(variant, photo)
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        stats.update({
+            "peak_mb": round(peak_bytes / 2 ** 20, 1),
+            "preview_payload_kb": round(payload_bytes / 1024, 1)
+        })
+        results[f"image_pipeline[{variant}, 12MP]"] = stats
+
+    if shutil.which("tesseract") is None:
+        print("Skipping process_image: tesseract not found")
+        return
+    import pytesseract
+    pytesseract.pytesseract.tesseract_cmd = shutil.which("tesseract")
+    encoded = cv2.imencode(".png", image)[1].tobytes()
+    results["process_image[default]"] = measure(
+        lambda: process_image(io.BytesIO(encoded), "default", show_ui=False), max(1, repeat // 2)
+    )
+
+def bench_pdf(results: Dict[str, Any], args: argparse.Namespace):
+    from utils.file_processors import process_pdf
+
+    repeat = args.repeat
+    for pages in (5, 50):
+        pdf = make_pdf(pages)
+        results[f"process_pdf[{pages}p]"] = measure(
+            lambda: process_pdf(io.BytesIO(pdf), show_ui=False), repeat
+        )
+
+def bench_embeddings(results: Dict[str, Any], args: argparse.Namespace):
+    from langchain_core.vectorstores import InMemoryVectorStore
+    from utils.astra_utils import initialize_embeddings
+
+    repeat = args.repeat
+    embeddings = initialize_embeddings()
+    if embeddings is None:
+        print("Skipping embeddings and vector search: embedding model unavailable")
+        return
+
+    documents = [f"{i}: {SAMPLE_TEXT}" for i in range(64)]
+    results["embed_documents[64]"] = measure(lambda: embeddings.embed_documents(documents), repeat)
+    results["embed_query"] = measure(lambda: embeddings.embed_query("revenue growth"), repeat * 4)
+
+    store = InMemoryVectorStore(embeddings)
+    store.add_texts([f"{i}: {SAMPLE_TEXT}" for i in range(1000)])
+    results["vector_search[1000 docs,k=3]"] = measure(
+        lambda: store.similarity_search("cloud services margin", k=3), repeat * 4
+    )
+
+TOPICS = ["revenue", "cloud", "invoice", "physics", "recipe", "contract", "network", "biology", "travel", "music"]
+ASPECTS = ["growth", "risk", "schedule", "cost", "quality", "history", "design", "safety"]
+
+def _embedding_backend_worker(backend: str, corpus: List[str], queries: List[str], repeat: int, queue):
+    """Measure one backend in a fresh process so memory numbers are not shared"""
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    from utils.astra_utils import initialize_embeddings
+    from utils.memory import rss_bytes
+
+    try:
+        rss_before = rss_bytes()
+        started = time.perf_counter()
+        embeddings = initialize_embeddings(backend)
+        if embeddings is None:
+            raise RuntimeError("initialize_embeddings returned None")
+        load_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        embeddings.embed_query(queries[0])
+        first_call_s = time.perf_counter() - started
+
+        stats = measure(lambda: embeddings.embed_documents(corpus), repeat)
+        stats.update({
+            "load_s": load_s,
+            "first_call_s": first_call_s,
+            "docs_per_s": len(corpus) / stats["p50_s"],
+            "rss_mb": round((rss_bytes() - rss_before) / 2 ** 20, 1),
+            "doc_vectors": embeddings.embed_documents(corpus),
+            "query_vectors": [embeddings.embed_query(query) for query in queries]
+        })
+    except Exception as e:
+        print(f"{backend} embeddings failed: {e}")
+        stats = None
+    queue.put(stats)
+
+def bench_embedding_backends(results: Dict[str, Any], args: argparse.Namespace):
+    import multiprocessing
+
+    corpus = [f"Notes on {topic} {aspect}: {SAMPLE_TEXT}" for topic in TOPICS for aspect in ASPECTS] * 2
+    queries = [f"What about {topic} {aspect}?" for topic in TOPICS for aspect in ASPECTS[:2]]
+
+    ctx = multiprocessing.get_context("spawn")
+    measured = {}
+    for backend in ("torch", "onnx"):
+        queue = ctx.Queue()
+        process = ctx.Process(target=_embedding_backend_worker,
+                              args=(backend, corpus, queries, args.repeat, queue))
+        process.start()
+        stats = queue.get()
+        process.join()
+        if stats is None:
+            print(f"Skipping {backend} embeddings: backend unavailable")
+            continue
+        measured[backend] = stats
+
+    if "torch" in measured and "onnx" in measured:
+        reference, candidate = measured["torch"], measured["onnx"]
+        doc_ref, doc_new = np.array(reference["doc_vectors"]), np.array(candidate["doc_vectors"])
+        query_ref, query_new = np.array(reference["query_vectors"]), np.array(candidate["query_vectors"])
+        # Vectors are normalized, so the row-wise dot product is the cosine
+        candidate["mean_cosine_vs_torch"] = float(np.mean(np.sum(doc_ref * doc_new, axis=1)))
+        top_ref = np.argsort(-query_ref @ doc_ref.T, axis=1)[:, :3]
+        top_new = np.argsort(-query_new @ doc_new.T, axis=1)[:, :3]
+        candidate["top3_agreement_vs_torch"] = float(np.mean([
+            len(set(a) & set(b)) / 3 for a, b in zip(top_ref, top_new)
+        ]))
+
+    for backend, stats in measured.items():
+        stats.pop("doc_vectors")
+        stats.pop("query_vectors")
+        results[f"embed_backend[{backend}]"] = stats
+
+def bench_models(results: Dict[str, Any], args: argparse.Namespace):
+    from utils.model_utils import ModelManager, BatchProcessor
+    from utils.async_runtime import run_sync
+
+    repeat = args.repeat
+    with FakeLLMServer(FakeLatency(latency=args.fake_latency)) as server:
+        server.install()
+        model_manager = ModelManager()
+        batch_processor = BatchProcessor(model_manager)
+
+        content = {'text': SAMPLE_TEXT * 20}
+        results["analyze_content[fake groq]"] = measure(
+            lambda: model_manager.analyze_content(content, GROQ_BENCH_MODEL, use_memory=False), repeat
+        )
+        batch = [{'text': SAMPLE_TEXT, 'id': f"item_{i}"} for i in range(8)]
+        results["process_batch[8, fake groq]"] = measure(
+            lambda: batch_processor.process_batch(batch, GROQ_BENCH_MODEL, show_ui=False, use_memory=False),
+            max(1, repeat // 2)
+        )
+        results["aprocess_batch[8, fake groq]"] = measure(
+            lambda: run_sync(batch_processor.aprocess_batch(batch, GROQ_BENCH_MODEL)), repeat
+        )
+
+def bench_routing(results: Dict[str, Any], args: argparse.Namespace):
+    from utils.fake_providers import FakeGenAI
+    from utils.model_utils import ModelManager
+    from utils.routing import ModelRouter
+
+    requests = args.repeat * 10
+    # Groq is flaky with a long tail; the Gemini fake is the healthy fallback
+    profile = FakeLatency(latency=args.fake_latency, jitter=args.fake_latency * 0.9, error_rate=0.1)
+    with FakeLLMServer(profile) as server:
+        server.install()
+        model_manager = ModelManager()
+        model_manager.clients["google"] = FakeGenAI(FakeLatency(latency=args.fake_latency))
+        content = {'text': SAMPLE_TEXT}
+
+        modes = {
+            "single": (ModelRouter({}), False),
+            "failover": (ModelRouter({GROQ_BENCH_MODEL: ["gemini-pro"]}), False),
+            "hedged": (ModelRouter({GROQ_BENCH_MODEL: ["gemini-pro"]}), True)
+        }
+        for mode, (router, hedge) in modes.items():
+            model_manager.router = router
+            samples, failures = [], 0
+            for _ in range(requests):
+                started = time.perf_counter()
+                if model_manager.analyze_content(content, GROQ_BENCH_MODEL, use_memory=False, hedge=hedge) is None:
+                    failures += 1
+                samples.append(time.perf_counter() - started)
+            samples.sort()
+            results[f"route[{mode}]"] = {
+                "n": requests,
+                "mean_s": statistics.fmean(samples),
+                "p50_s": samples[len(samples) // 2],
+                "p95_s": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                "min_s": samples[0],
+                "error_rate": failures / requests
+            }
+
+def bench_api(results: Dict[str, Any], args: argparse.Namespace):
+    import asyncio
+    import aiohttp
+    from aiohttp import web
+    from api_server import create_app, create_fake_backends
+
+    concurrency, requests = 16, args.repeat * 16
+
+    async def run():
+        model_manager, vector_store, server = create_fake_backends(args.fake_latency)
+        await asyncio.to_thread(
+            vector_store.add_texts, [f"{topic}: {SAMPLE_TEXT}" for topic in TOPICS]
+        )
+        runner = web.AppRunner(create_app(model_manager, vector_store, max_concurrency=concurrency * 4))
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+        endpoints = {
+            "search": {"query": "cloud revenue", "k": 3},
+            "analyze": {"text": SAMPLE_TEXT, "model": GROQ_BENCH_MODEL},
+            "chat": {"message": "How did revenue change?", "model": GROQ_BENCH_MODEL}
+        }
+        # One pooled connector per client, so requests reuse keep-alive connections
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        try:
+            async with aiohttp.ClientSession(connector=connector) as session:
+                for endpoint, body in endpoints.items():
+                    async def call() -> float:
+                        started = time.perf_counter()
+                        async with session.post(f"{base}/{endpoint}", json=body) as response:
+                            await response.read()
+                            response.raise_for_status()
+                        return time.perf_counter() - started
+
+                    await call()
+                    started = time.perf_counter()
+                    samples = sorted(await asyncio.gather(*(call() for _ in range(requests))))
+                    wall = time.perf_counter() - started
+                    results[f"api[{endpoint}, {concurrency} conns]"] = {
+                        "n": requests,
+                        "mean_s": statistics.fmean(samples),
+                        "p50_s": samples[len(samples) // 2],
+                        "p95_s": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                        "min_s": samples[0],
+                        "throughput_per_s": requests / wall
+                    }
+        finally:
+            await runner.cleanup()
+            server.stop()
+
+    asyncio.run(run())
+
+def bench_workers(results: Dict[str, Any], args: argparse.Namespace):
+    import tempfile
+    from utils.job_queue import JobQueue, start_workers
+
+    jobs = args.repeat * 4
+    with FakeLLMServer(FakeLatency(latency=args.fake_latency)) as server, \
+            tempfile.TemporaryDirectory() as workdir:
+        # Workers are spawned, so they reach the fake server through the environment
+        server.install()
+        pdf_path = os.path.join(workdir, "report.pdf")
+        with open(pdf_path, "wb") as pdf_file:
+            pdf_file.write(make_pdf(pages=5))
+        payload = {"path": pdf_path, "filename": "report.pdf", "model_name": GROQ_BENCH_MODEL,
+                   "analysis_type": "general", "store": False}
+
+        def run_jobs(queue: JobQueue, count: int) -> List[Dict[str, Any]]:
+            job_ids = [queue.submit("pdf", payload) for _ in range(count)]
+            while True:
+                finished = queue.list_jobs(job_ids)
+                if all(job["status"] in ("succeeded", "failed", "cancelled") for job in finished):
+                    return finished
+                time.sleep(0.05)
+
+        for count in (1, 2, 4):
+            queue = JobQueue(os.path.join(workdir, f"jobs{count}.sqlite3"))
+            workers = start_workers(count, queue.db_path)
+            try:
+                # Process start-up and imports are not part of the measurement
+                run_jobs(queue, count * 2)
+                started = time.perf_counter()
+                finished = run_jobs(queue, jobs)
+                wall = time.perf_counter() - started
+            finally:
+                for worker in workers:
+                    worker.terminate()
+                    worker.join()
+
+            samples = sorted(job["finished_at"] - job["created_at"] for job in finished)
+            results[f"jobs[{count} workers]"] = {
+                "n": jobs,
+                "mean_s": statistics.fmean(samples),
+                "p50_s": samples[len(samples) // 2],
+                "p95_s": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                "min_s": samples[0],
+                "throughput_per_s": jobs / wall,
+                "error_rate": sum(job["status"] != "succeeded" for job in finished) / jobs
+            }
+
+BENCHMARKS = {
+    "images": bench_images,
+    "pdf": bench_pdf,
+    "embeddings": bench_embeddings,
+    "embedding_backends": bench_embedding_backends,
+    "models": bench_models,
+    "routing": bench_routing,
+    "api": bench_api,
+    "workers": bench_workers
+}
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return the benchmarks whose p50 regressed past the tolerance"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        ratio = current["p50_s"] / previous["p50_s"] if previous["p50_s"] else 1.0
+        current["vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: p50 {previous['p50_s']:.4f}s -> {current['p50_s']:.4f}s ({ratio:.2f}x)")
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the OCR, PDF, embedding and model paths")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS.keys()),
+                        help="Run a subset of the benchmark groups")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed iterations per benchmark")
+    parser.add_argument("--fake-latency", type=float, default=0.2,
+                        help="Seconds the fake LLM server waits before answering")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write results (JSON)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed p50 slowdown vs. baseline before failing (0.2 = 20%%)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Write these results as the new baseline")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    results: Dict[str, Any] = {}
+    for group in args.only or BENCHMARKS.keys():
+        print(f"Running {group} benchmarks...")
+        BENCHMARKS[group](results, args)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "fake_latency_s": args.fake_latency
+        },
+        "results": results
+    }
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+
+    for name, stats in results.items():
+        marker = f"  ({stats['vs_baseline']}x baseline)" if "vs_baseline" in stats else ""
+        print(f"{name:40s} p50 {stats['p50_s'] * 1000:9.2f} ms  p95 {stats['p95_s'] * 1000:9.2f} ms{marker}")
+
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+
+    if regressions:
+        print("\n❌ Regressions against baseline:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
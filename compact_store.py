@@ -0,0 +1,40 @@
+# compact_store.py
+import sys
+import json
+import logging
+import argparse
+import warnings
+
+from dotenv import load_dotenv
+
+warnings.filterwarnings('ignore', category=UserWarning)
+
+from utils.astra_utils import initialize_embeddings, initialize_astra, compact_duplicates
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Remove duplicate documents from the AstraDB collection and re-key the rest by content hash"
+    )
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only report what would be migrated and deleted")
+    parser.add_argument("--batch-size", type=int, default=20,
+                        help="Documents deleted per request")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    load_dotenv()
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    embeddings = initialize_embeddings()
+    vector_store = initialize_astra(embeddings) if embeddings else None
+    if vector_store is None:
+        print("❌ Could not initialize AstraDB")
+        return 1
+
+    summary = compact_duplicates(vector_store, dry_run=args.dry_run, batch_size=args.batch_size)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+# load_test.py
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import threading
+import statistics
+import multiprocessing
+import warnings
+from datetime import datetime
+from typing import Dict, Any, List, Tuple
+
+warnings.filterwarnings('ignore', category=UserWarning)
+
+from utils.fake_providers import FakeLLMServer, FakeLatency
+from utils.memory import rss_bytes
+
+MODEL = "llama-3.3-70b-versatile"
+
+def _serve_fake(latency: float, url_queue):
+    """Run the fake Groq server in its own process so it does not skew our numbers"""
+    server = FakeLLMServer(FakeLatency(latency)).start()
+    url_queue.put(server.url)
+    threading.Event().wait()
+
+class Sampler:
+    """Track peak thread count and RSS while a load level runs"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_threads = 0
+        self.peak_rss_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            self.peak_rss_mb = max(self.peak_rss_mb, rss_bytes() / 2 ** 20)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def run_blocking(model_manager, sessions: int, requests: int) -> Tuple[List[float], List[str]]:
+    """Previous behaviour: one thread per session, blocking client calls"""
+    latencies, errors = [], []
+
+    def session(index: int):
+        for request in range(requests):
+            started = time.perf_counter()
+            try:
+                model = model_manager._build_model(MODEL)
+                model.invoke({"input": f"session {index} request {request}", "chat_history": []})
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(str(e))
+
+    threads = [threading.Thread(target=session, args=(index,)) for index in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+def run_async(model_manager, sessions: int, requests: int) -> Tuple[List[float], List[str]]:
+    """Async API: every session is a task on the shared event loop"""
+    from utils.async_runtime import run_sync
+    latencies, errors = [], []
+
+    async def session(index: int):
+        for request in range(requests):
+            started = time.perf_counter()
+            result = await model_manager.aanalyze_content(
+                {"text": f"session {index} request {request}"}, MODEL, use_memory=False
+            )
+            if result is None:
+                errors.append("analysis failed")
+            else:
+                latencies.append(time.perf_counter() - started)
+
+    async def all_sessions():
+        await asyncio.gather(*(session(index) for index in range(sessions)))
+
+    run_sync(all_sessions())
+    return latencies, errors
+
+MODES = {
+    "blocking": run_blocking,
+    "async": run_async
+}
+
+def run_level(model_manager, mode: str, sessions: int, requests: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    with Sampler() as sampler:
+        latencies, errors = MODES[mode](model_manager, sessions, requests)
+    wall = time.perf_counter() - started
+    ordered = sorted(latencies) or [0.0]
+    return {
+        "sessions": sessions,
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(latencies) / wall, 2),
+        "p50_s": round(statistics.median(ordered), 4),
+        "p95_s": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+        "peak_threads": sampler.peak_threads,
+        "peak_rss_mb": round(sampler.peak_rss_mb, 1)
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure how many concurrent sessions one process sustains against a fake LLM"
+    )
+    parser.add_argument("--modes", nargs="+", choices=list(MODES.keys()), default=list(MODES.keys()))
+    parser.add_argument("--sessions", nargs="+", type=int, default=[10, 50, 100, 200, 400],
+                        help="Concurrent session counts to try")
+    parser.add_argument("--requests", type=int, default=3, help="Sequential requests per session")
+    parser.add_argument("--fake-latency", type=float, default=0.5,
+                        help="Seconds the fake LLM server waits before answering")
+    parser.add_argument("--slo", type=float, default=None,
+                        help="p95 latency a level must stay under to count as sustained "
+                             "(default: 2x the fake latency)")
+    parser.add_argument("--output", default="load_test_results.json", help="Where to write results (JSON)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    slo = args.slo or 2 * args.fake_latency
+
+    context = multiprocessing.get_context("spawn")
+    url_queue = context.Queue()
+    server = context.Process(target=_serve_fake, args=(args.fake_latency, url_queue), daemon=True)
+    server.start()
+    os.environ["GROQ_API_BASE"] = url_queue.get(timeout=30)
+    os.environ.setdefault("GROQ_API_KEY", "fake-key")
+
+    from utils.model_utils import ModelManager
+    model_manager = ModelManager()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "cpu_count": os.cpu_count(),
+            "fake_latency_s": args.fake_latency,
+            "requests_per_session": args.requests,
+            "slo_p95_s": slo
+        },
+        "results": {}
+    }
+
+    try:
+        for mode in args.modes:
+            # Warm up clients and connection pools outside the measurements
+            MODES[mode](model_manager, 1, 1)
+            levels = []
+            for sessions in args.sessions:
+                level = run_level(model_manager, mode, sessions, args.requests)
+                level["sustained"] = level["errors"] == 0 and level["p95_s"] <= slo
+                levels.append(level)
+                print(f"{mode:9s} {sessions:5d} sessions  {level['throughput_per_s']:8.1f} req/s  "
+                      f"p50 {level['p50_s']:.3f}s  p95 {level['p95_s']:.3f}s  "
+                      f"errors {level['errors']:4d}  threads {level['peak_threads']:4d}  "
+                      f"rss {level['peak_rss_mb']:.0f} MB")
+            sustained = [level["sessions"] for level in levels if level["sustained"]]
+            report["results"][mode] = {
+                "levels": levels,
+                "max_sustained_sessions": max(sustained) if sustained else 0
+            }
+    finally:
+        server.terminate()
+
+    print()
+    for mode, result in report["results"].items():
+        print(f"{mode}: sustains {result['max_sustained_sessions']} concurrent sessions "
+              f"(p95 <= {slo:.2f}s, no errors)")
+
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
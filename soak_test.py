@@ -0,0 +1,193 @@
+# soak_test.py
+import io
+import gc
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import warnings
+import tracemalloc
+from datetime import datetime
+from typing import Dict, Any, List
+
+warnings.filterwarnings('ignore', category=UserWarning)
+
+import cv2
+
+from utils.fake_providers import FakeLLMServer, FakeLatency, FakeGenAI
+from utils.memory import rss_bytes, session_state_sizes, _SNAPSHOT_FILTERS
+from utils.tracing import trace
+from benchmark import make_text_image, make_pdf, SAMPLE_TEXT, GROQ_BENCH_MODEL
+
+class ScriptedSession:
+    """Replays what one user does in the app, turn after turn, against fake providers
+
+    Every turn starts like a Streamlit rerun: a new ModelManager and
+    BatchProcessor, and the same session state dict as before.
+    """
+
+    def __init__(self, vector_store, workdir: str, documents: int = 5):
+        self.vector_store = vector_store
+        self.workdir = workdir
+        self.state: Dict[str, Any] = {"messages": [], "batch_results": None, "last_trace": None}
+        self.image = cv2.imencode(".png", make_text_image(800, 600, 12))[1].tobytes()
+        self.pdfs = [make_pdf(pages=3 + index) for index in range(documents)]
+
+    def rerun(self):
+        from utils.model_utils import ModelManager, BatchProcessor
+        model_manager = ModelManager()
+        model_manager.clients["google"] = FakeGenAI(FakeLatency(latency=0.0))
+        return model_manager, BatchProcessor(model_manager)
+
+    def turn(self, index: int):
+        from utils.file_processors import process_image, process_pdf, make_preview
+        from utils.astra_utils import store_in_astra, search_astra, chunk_size_for
+        from utils import results_store
+
+        # Single image upload: preview, OCR, analysis
+        model_manager, batch_processor = self.rerun()
+        with trace("upload:image/png") as request_trace:
+            upload = io.BytesIO(self.image)
+            make_preview(upload)
+            text, confidence, stats = process_image(upload, show_ui=False)
+            model_manager.analyze_content({'text': text or SAMPLE_TEXT}, GROQ_BENCH_MODEL)
+        self.state["last_trace"] = request_trace
+
+        # PDF upload: extraction, analysis and storage of a document seen before
+        model_manager, batch_processor = self.rerun()
+        pdf = io.BytesIO(self.pdfs[index % len(self.pdfs)])
+        with trace("upload:application/pdf") as request_trace:
+            text = process_pdf(pdf, show_ui=False)
+            model_manager.analyze_content({'text': text}, GROQ_BENCH_MODEL)
+            store_in_astra(self.vector_store, text, {"file_type": "pdf", "filename": f"doc{index}.pdf"},
+                           chunk_size=chunk_size_for("pdf"))
+        self.state["last_trace"] = request_trace
+
+        # Small batch written to Parquet, replacing the previous one like the app does
+        model_manager, batch_processor = self.rerun()
+        path = os.path.join(self.workdir, f"batch{index % 2}.parquet")
+        with results_store.BatchResultWriter(path) as writer:
+            batch_processor.process_batch(
+                [{'text': SAMPLE_TEXT, 'id': f"item_{item}"} for item in range(4)],
+                GROQ_BENCH_MODEL, show_ui=False, use_memory=False,
+                on_result=lambda result: writer.write({**result, 'status': result.get('status')})
+            )
+        self.state["batch_results"] = {'uploads': [f"batch{index}"], 'path': path}
+
+        # Chat turn with knowledge base context, streamed
+        model_manager, batch_processor = self.rerun()
+        prompt = f"What does document {index % len(self.pdfs)} say about revenue?"
+        with trace("chat") as request_trace:
+            context = "\n".join(doc.page_content[:500] for doc in search_astra(self.vector_store, prompt, k=3))
+            answer = "".join(model_manager.stream_content({'text': prompt + "\n" + context}, GROQ_BENCH_MODEL))
+        self.state["last_trace"] = request_trace
+        self.state["messages"].extend([
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": answer}
+        ])
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Replay a scripted session against fake providers and fail if memory keeps growing"
+    )
+    parser.add_argument("--turns", type=int, default=100, help="Measured turns")
+    parser.add_argument("--warmup", type=int, default=20,
+                        help="Turns run before the baseline, so caches and pools fill up first")
+    parser.add_argument("--max-growth-mb", type=float, default=64.0,
+                        help="RSS growth over the measured turns that fails the test")
+    parser.add_argument("--max-traced-growth-mb", type=float, default=16.0,
+                        help="Python heap growth (tracemalloc) that fails the test")
+    parser.add_argument("--no-tracemalloc", action="store_true",
+                        help="Measure RSS only; faster, but no allocation sites are reported")
+    parser.add_argument("--top", type=int, default=10, help="Allocation sites to report")
+    parser.add_argument("--output", default="soak_results.json", help="Where to write results (JSON)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_core.vectorstores import InMemoryVectorStore
+
+    server = FakeLLMServer(FakeLatency(latency=0.0)).start()
+    server.install()
+    vector_store = InMemoryVectorStore(DeterministicFakeEmbedding(size=384))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        session = ScriptedSession(vector_store, workdir)
+        for index in range(args.warmup):
+            session.turn(index)
+
+        if not args.no_tracemalloc:
+            tracemalloc.start()
+        gc.collect()
+        baseline_rss = rss_bytes()
+        baseline = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS) if tracemalloc.is_tracing() else None
+        baseline_traced = tracemalloc.get_traced_memory()[0] if baseline else 0
+
+        started = time.perf_counter()
+        rss_trend: List[float] = []
+        for index in range(args.turns):
+            session.turn(args.warmup + index)
+            if index % 10 == 9:
+                rss_trend.append(round((rss_bytes() - baseline_rss) / 2 ** 20, 2))
+                print(f"turn {index + 1:5d}  rss {rss_trend[-1]:+8.2f} MB")
+        elapsed = time.perf_counter() - started
+
+        gc.collect()
+        rss_growth_mb = (rss_bytes() - baseline_rss) / 2 ** 20
+        traced_growth_mb, top = 0.0, []
+        if baseline:
+            traced_growth_mb = (tracemalloc.get_traced_memory()[0] - baseline_traced) / 2 ** 20
+            snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+            for stat in snapshot.compare_to(baseline, "lineno")[:args.top]:
+                frame = stat.traceback[0]
+                top.append({
+                    "site": f"{frame.filename}:{frame.lineno}",
+                    "growth_kb": round(stat.size_diff / 1024, 1),
+                    "count_growth": stat.count_diff
+                })
+            tracemalloc.stop()
+
+        state_sizes = session_state_sizes(session.state)
+    server.stop()
+
+    failures = []
+    if rss_growth_mb > args.max_growth_mb:
+        failures.append(f"RSS grew {rss_growth_mb:.1f} MB (limit {args.max_growth_mb:.1f} MB)")
+    if traced_growth_mb > args.max_traced_growth_mb:
+        failures.append(f"Python heap grew {traced_growth_mb:.1f} MB (limit {args.max_traced_growth_mb:.1f} MB)")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "turns": args.turns,
+            "warmup": args.warmup,
+            "elapsed_s": round(elapsed, 1)
+        },
+        "rss_growth_mb": round(rss_growth_mb, 2),
+        "traced_growth_mb": round(traced_growth_mb, 2),
+        "rss_trend_mb": rss_trend,
+        "session_state_bytes": state_sizes,
+        "top_growth_sites": top,
+        "failures": failures
+    }
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+
+    print()
+    print(f"RSS growth {rss_growth_mb:+.2f} MB, Python heap growth {traced_growth_mb:+.2f} MB "
+          f"over {args.turns} turns ({elapsed:.0f}s)")
+    print(f"Session state: {sum(state_sizes.values()) / 1024:.1f} KB")
+    for row in top:
+        print(f"  {row['growth_kb']:+10.1f} KB  {row['count_growth']:+7d}  {row['site']}")
+    for failure in failures:
+        print(f"❌ {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
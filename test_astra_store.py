@@ -0,0 +1,73 @@
+# test_astra_store.py
+import logging
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from utils.astra_utils import store_in_astra, content_hash, document_id
+
+TEXT = " ".join(
+    f"Section {section}: revenue grew 12 percent on cloud services while costs stayed flat."
+    for section in range(60)
+)
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """Fake embedding that counts the texts it was asked to embed"""
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+def new_store():
+    embeddings = CountingEmbedding(size=64)
+    return InMemoryVectorStore(embeddings), embeddings
+
+def test_same_text_is_not_embedded_twice():
+    print("Testing content-hash upserts...")
+    vector_store, embeddings = new_store()
+
+    assert store_in_astra(vector_store, TEXT, {"filename": "a.txt"})
+    assert store_in_astra(vector_store, "  " + TEXT.replace(" ", "\n", 3), {"filename": "b.txt"})
+
+    assert embeddings.embedded == 1, f"embedded {embeddings.embedded} times"
+    assert list(vector_store.store) == [document_id(content_hash(TEXT))], list(vector_store.store)
+    print("✅ Re-uploaded text (with different whitespace) was not embedded again")
+
+def test_chunked_text_is_not_embedded_twice():
+    print("\nTesting chunked upserts...")
+    vector_store, embeddings = new_store()
+
+    assert store_in_astra(vector_store, TEXT, {"filename": "a.pdf"}, chunk_size=1000)
+    chunks = embeddings.embedded
+    assert chunks > 1, "text was not split"
+    assert store_in_astra(vector_store, TEXT, {"filename": "a.pdf"}, chunk_size=1000)
+
+    assert embeddings.embedded == chunks, f"embedded {embeddings.embedded - chunks} chunks again"
+    assert len(vector_store.store) == chunks, len(vector_store.store)
+    print(f"✅ {chunks} chunks stored once")
+
+def test_chunking_is_part_of_the_id():
+    print("\nTesting IDs of whole and chunked copies...")
+    vector_store, embeddings = new_store()
+
+    # The first chunk of a chunked copy must not be mistaken for the whole text
+    assert store_in_astra(vector_store, TEXT, {"filename": "a.txt"})
+    assert store_in_astra(vector_store, TEXT, {"filename": "a.pdf"}, chunk_size=1000)
+    assert store_in_astra(vector_store, TEXT, {"filename": "a.pdf"}, chunk_size=500)
+
+    whole_id = document_id(content_hash(TEXT))
+    assert vector_store.store[whole_id]["text"] == TEXT, "whole document was overwritten"
+    first_chunks = [document_id(content_hash(TEXT), 0, size) for size in (1000, 500)]
+    for doc_id, size in zip(first_chunks, (1000, 500)):
+        assert len(vector_store.store[doc_id]["text"]) <= size, f"{doc_id} is not a {size}-character chunk"
+        assert vector_store.store[doc_id]["metadata"]["chunk_size"] == size
+    print(f"✅ Whole text and both chunkings stored side by side ({len(vector_store.store)} documents)")
+
+if __name__ == "__main__":
+    # Streamlit calls inside the utils are no-ops here; silence their warnings
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    test_same_text_is_not_embedded_twice()
+    test_chunked_text_is_not_embedded_twice()
+    test_chunking_is_part_of_the_id()
+    print("\n✨ All storage tests passed!")
@@ -0,0 +1,157 @@
+# test_job_queue.py
+import os
+import time
+import tempfile
+import threading
+import subprocess
+
+from utils import job_queue
+from utils.job_queue import JobQueue, JobCancelled
+
+def new_queue(workdir):
+    return JobQueue(os.path.join(workdir, "jobs.sqlite3"))
+
+def test_claim():
+    print("Testing job claims...")
+    with tempfile.TemporaryDirectory() as workdir:
+        queue = new_queue(workdir)
+        job_ids = [queue.submit("image", {"filename": f"page{index}.png"}) for index in range(40)]
+
+        # Oldest job first, marked running by the claiming worker
+        first = queue.claim("worker-0")
+        assert first["id"] == job_ids[0], "claim did not take the oldest job"
+        assert first["status"] == "running" and first["worker"] == "worker-0", first
+
+        # Workers claiming at once never get the same job
+        claimed, lock = [first["id"]], threading.Lock()
+        def drain(worker_id):
+            while (job := queue.claim(worker_id)) is not None:
+                with lock:
+                    claimed.append(job["id"])
+        threads = [threading.Thread(target=drain, args=(f"worker-{index}",)) for index in range(1, 9)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(claimed) == sorted(job_ids), "jobs were lost or claimed twice"
+        assert queue.claim("worker-0") is None, "claim returned a job from an empty queue"
+        print(f"✅ {len(claimed)} jobs claimed once each by 9 workers")
+
+def test_cancel():
+    print("\nTesting cancellation...")
+    with tempfile.TemporaryDirectory() as workdir:
+        queue = new_queue(workdir)
+
+        # A queued job is cancelled at once and never handed to a worker
+        queued = queue.submit("image", {"filename": "queued.png"})
+        queue.cancel(queued)
+        assert queue.get(queued)["status"] == "cancelled", queue.get(queued)
+        assert queue.claim("worker-0") is None, "cancelled job was claimed"
+
+        # A running job is asked to stop; the worker finds out at its next checkpoint
+        running = queue.submit("image", {"filename": "running.png"})
+        queue.claim("worker-0")
+        queue.cancel(running)
+        assert queue.get(running)["status"] == "running", "running job was cancelled under its worker"
+        try:
+            queue.set_progress(running, 0.5)
+        except JobCancelled:
+            pass
+        else:
+            raise AssertionError("set_progress did not raise JobCancelled")
+        print("✅ Queued jobs cancelled immediately; running jobs told to stop")
+
+def test_worker_honours_cancel():
+    print("\nTesting cancellation inside a worker...")
+    with tempfile.TemporaryDirectory() as workdir:
+        queue = new_queue(workdir)
+        started = threading.Event()
+
+        def slow_job(queue, job, context):
+            started.set()
+            for step in range(50):
+                queue.set_progress(job["id"], step / 50)
+                time.sleep(0.02)
+            return {}
+
+        job_queue.JOB_HANDLERS["slow"] = slow_job
+        try:
+            job_id = queue.submit("slow", {"filename": "slow.bin"})
+            worker = threading.Thread(target=job_queue.run_worker, args=(queue.db_path,),
+                                      kwargs={"poll_interval": 0.01, "max_jobs": 1})
+            worker.start()
+            assert started.wait(5), "worker never started the job"
+            queue.cancel(job_id)
+            worker.join(5)
+        finally:
+            del job_queue.JOB_HANDLERS["slow"]
+
+        job = queue.get(job_id)
+        assert job["status"] == "cancelled", job
+        assert job["progress"] < 1, "job ran to completion after being cancelled"
+        print(f"✅ Worker stopped at {job['progress']:.0%} and marked the job cancelled")
+
+def test_cancel_between_stages():
+    print("\nTesting cancellation during a single long step...")
+    from utils import file_processors, astra_utils
+
+    with tempfile.TemporaryDirectory() as workdir:
+        queue = new_queue(workdir)
+        job_id = queue.submit("image", {"filename": "scan.png", "path": "scan.png",
+                                        "model_name": "gemini-pro", "store": True})
+        job = queue.claim("worker-0")
+
+        # The model call makes no progress callbacks; the cancel lands while it runs
+        class SlowModels:
+            def needs_map_reduce(self, *args):
+                return False
+            def analyze_content(self, *args, **kwargs):
+                queue.cancel(job_id)
+                return {"analysis": "Revenue grew"}
+        class Context:
+            model_manager = SlowModels()
+            vector_store = None
+
+        stored = []
+        process_image, store_in_astra = file_processors.process_image, astra_utils.store_in_astra
+        file_processors.process_image = lambda *args, **kwargs: ("Quarterly revenue grew", 90.0, {})
+        astra_utils.store_in_astra = lambda *args, **kwargs: stored.append(args) or True
+        try:
+            job_queue._run_image_job(queue, job, Context())
+        except JobCancelled:
+            pass
+        else:
+            raise AssertionError("job ran on after being cancelled during the model call")
+        finally:
+            file_processors.process_image, astra_utils.store_in_astra = process_image, store_in_astra
+
+        assert stored == [], "results were stored after the job was cancelled"
+        print("✅ Cancel during the model call stopped the job before storing")
+
+def test_requeue_stale():
+    print("\nTesting requeue of jobs from dead workers...")
+    with tempfile.TemporaryDirectory() as workdir:
+        queue = new_queue(workdir)
+        dead_worker = subprocess.Popen(["sleep", "0"])
+        dead_worker.wait()
+
+        orphaned = queue.submit("image", {"filename": "orphaned.png"})
+        alive = queue.submit("image", {"filename": "alive.png"})
+        queue.claim(str(dead_worker.pid))
+        queue.claim(str(os.getpid()))
+        queue.requeue_stale()
+
+        job = queue.get(orphaned)
+        assert job["status"] == "queued" and job["worker"] is None, job
+        assert queue.get(alive)["status"] == "running", "job of a live worker was requeued"
+        assert queue.claim("worker-1")["id"] == orphaned, "requeued job could not be claimed again"
+        print("✅ Jobs of dead workers requeued; jobs of live workers kept")
+
+if __name__ == "__main__":
+    test_claim()
+    test_cancel()
+    test_worker_honours_cancel()
+    test_cancel_between_stages()
+    test_requeue_stale()
+    print("\n✨ All job queue tests passed!")
@@ -0,0 +1,97 @@
+# test_routing.py
+import time
+import asyncio
+import logging
+
+from utils.fake_providers import FakeLLMServer, FakeLatency, FakeGenAI
+from utils.async_runtime import run_sync
+from utils.routing import ModelRouter
+
+def make_manager(server, gemini_profile):
+    """ModelManager against the fake providers, with a router of its own"""
+    from utils.model_utils import ModelManager
+    model_manager = ModelManager()
+    model_manager.clients["google"] = FakeGenAI(gemini_profile)
+    model_manager.router = ModelRouter(
+        {name: config.fallbacks for name, config in model_manager.MODELS.items()}
+    )
+
+    # Record every model attempted, and the ones cancelled mid-request
+    model_manager.attempts, model_manager.cancelled = [], []
+    ainvoke = model_manager._ainvoke
+    async def recording_ainvoke(model_name, *args):
+        model_manager.attempts.append(model_name)
+        try:
+            return await ainvoke(model_name, *args)
+        except asyncio.CancelledError:
+            model_manager.cancelled.append(model_name)
+            raise
+    model_manager._ainvoke = recording_ainvoke
+    return model_manager
+
+def analyze(model_manager, model_name):
+    return run_sync(model_manager.aanalyze_content(
+        {'text': "Quarterly revenue grew while costs fell."}, model_name, use_memory=False
+    ))
+
+def test_failover_order():
+    print("Testing failover order...")
+    with FakeLLMServer(FakeLatency(latency=0.0, error_rate=1.0)) as server:
+        server.install()
+        model_manager = make_manager(server, FakeLatency(latency=0.0))
+
+        result = analyze(model_manager, "mixtral-8x7b-32768")
+        assert result is not None, "analysis failed although Gemini was healthy"
+        assert result["model"] == "gemini-pro", result["model"]
+        assert model_manager.attempts == ["mixtral-8x7b-32768", "llama-3.3-70b-versatile", "gemini-pro"], \
+            model_manager.attempts
+        print(f"✅ Tried {' → '.join(model_manager.attempts)}")
+
+def test_circuit_opens():
+    print("\nTesting circuit breaker...")
+    with FakeLLMServer(FakeLatency(latency=0.0, error_rate=1.0)) as server:
+        server.install()
+        model_manager = make_manager(server, FakeLatency(latency=0.0))
+
+        health = model_manager.router.health_for("mixtral-8x7b-32768")
+        for _ in range(health.failure_threshold):
+            analyze(model_manager, "mixtral-8x7b-32768")
+        assert not health.available, "circuit still closed after repeated failures"
+
+        # Requests skip both open Groq circuits and go straight to Gemini
+        model_manager.attempts.clear()
+        requests_before = server.request_count
+        result = analyze(model_manager, "mixtral-8x7b-32768")
+        assert result["model"] == "gemini-pro", result["model"]
+        assert model_manager.attempts == ["gemini-pro"], model_manager.attempts
+        assert server.request_count == requests_before, "Groq was called with its circuit open"
+        print(f"✅ Circuit opened after {health.failure_threshold} failures; Groq skipped")
+
+def test_hedge_cancels_loser():
+    print("\nTesting request hedging...")
+    with FakeLLMServer(FakeLatency(latency=0.0)) as server:
+        server.install()
+        model_manager = make_manager(server, FakeLatency(latency=2.0))
+
+        # Gemini usually answers in 50 ms; now it takes 2 s, so llama is raced against it
+        for _ in range(5):
+            model_manager.router.health_for("gemini-pro").record_success(0.05)
+        started = time.perf_counter()
+        result = run_sync(model_manager.aanalyze_content(
+            {'text': "Quarterly revenue grew while costs fell."}, "gemini-pro", use_memory=False, hedge=True
+        ))
+        elapsed = time.perf_counter() - started
+
+        assert result["model"] == "llama-3.3-70b-versatile", result["model"]
+        assert model_manager.attempts == ["gemini-pro", "llama-3.3-70b-versatile"], model_manager.attempts
+        assert model_manager.cancelled == ["gemini-pro"], model_manager.cancelled
+        assert elapsed < 1.0, f"hedged request took {elapsed:.2f}s"
+        print(f"✅ Hedge answered in {elapsed:.2f}s; slow Gemini request cancelled")
+
+if __name__ == "__main__":
+    # Streamlit calls inside the utils are no-ops here; silence their warnings
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    test_failover_order()
+    test_circuit_opens()
+    test_hedge_cancels_loser()
+    print("\n✨ All routing tests passed!")
@@ -3,7 +3,9 @@ from .file_processors import (
     process_image,
     process_pdf,
     process_video,
-    process_batch_images
+    process_batch_images,
+    load_image_gray,
+    make_preview
 )
 from .model_utils import ModelManager, BatchProcessor
 from .astra_utils import (
@@ -18,6 +20,8 @@ __all__ = [
     'process_pdf',
     'process_video',
     'process_batch_images',
+    'load_image_gray',
+    'make_preview',
     'ModelManager',
     'BatchProcessor',
     'initialize_embeddings',
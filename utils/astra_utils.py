@@ -2,15 +2,59 @@
 import streamlit as st
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_astradb import AstraDBVectorStore
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 import os
-from typing import Optional, List
+import hashlib
+import platform
+from collections import defaultdict
+from typing import Optional, List, Dict, Any, Set, Tuple
 
-def initialize_embeddings() -> Optional[HuggingFaceEmbeddings]:
-    """Initialize embeddings model"""
+from .tracing import span
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BACKENDS = ("torch", "onnx")
+
+# Characters per stored chunk for long documents; the embedding model only
+# reads the first ~256 tokens of a text, and chat pastes search hits into prompts
+DOCUMENT_CHUNK_SIZE = int(os.getenv("DOCUMENT_CHUNK_SIZE", "1000"))
+
+# File types stored in chunks rather than as one document
+CHUNKED_FILE_TYPES = ("pdf",)
+
+def _default_onnx_file() -> str:
+    """Pick the int8-quantized ONNX export of the model that suits this CPU"""
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    # AVX2 runs on practically every x86-64 server; AVX-512 hosts can override
+    return "onnx/model_quint8_avx2.onnx"
+
+def initialize_embeddings(backend: Optional[str] = None) -> Optional[HuggingFaceEmbeddings]:
+    """Initialize embeddings model
+
+    ``backend`` (default: ``EMBEDDING_BACKEND`` env var, else ``torch``)
+    selects full torch inference or an int8-quantized ONNX Runtime model.
+    Both produce normalized vectors in the same space, so existing stored
+    embeddings stay searchable. ``EMBEDDING_ONNX_FILE`` picks another ONNX
+    export from the model repository.
+    """
+    backend = (backend or os.getenv("EMBEDDING_BACKEND", "torch")).lower()
     try:
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {backend}")
+        
+        model_kwargs = {'device': 'cpu'}
+        if backend == "onnx":
+            model_kwargs.update({
+                'backend': 'onnx',
+                'model_kwargs': {
+                    'file_name': os.getenv("EMBEDDING_ONNX_FILE", _default_onnx_file()),
+                    'provider': 'CPUExecutionProvider'
+                }
+            })
+        
         embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'},
+            model_name=EMBEDDING_MODEL,
+            model_kwargs=model_kwargs,
             encode_kwargs={'normalize_embeddings': True}
         )
         return embeddings
@@ -33,24 +77,165 @@ def initialize_astra(embeddings: HuggingFaceEmbeddings) -> Optional[AstraDBVecto
         st.error(f"Failed to initialize AstraDB: {str(e)}")
         return None
 
+def content_hash(text: str) -> str:
+    """Stable hash of a text, ignoring differences in whitespace"""
+    normalized = " ".join(text.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+def document_id(text_hash: str, position: int = 0, chunk_size: Optional[int] = None) -> str:
+    """Deterministic document ID for one chunk of a text
+
+    The chunk size is part of the ID, so a text stored whole and the same
+    text split into chunks never share an ID.
+    """
+    if chunk_size:
+        return f"{text_hash}-c{chunk_size}-{position}"
+    return f"{text_hash}-{position}"
+
+def chunk_size_for(file_type: Optional[str]) -> Optional[int]:
+    """``chunk_size`` to store a file type with; None stores it whole"""
+    return DOCUMENT_CHUNK_SIZE if file_type in CHUNKED_FILE_TYPES else None
+
+def _existing_ids(vector_store: AstraDBVectorStore, ids: List[str]) -> Set[str]:
+    """Which of the given document IDs are already stored"""
+    if not hasattr(vector_store, 'astra_env'):
+        # Other LangChain vector stores, e.g. the in-memory one used in tests
+        return {document.id for document in vector_store.get_by_ids(ids)}
+    
+    found = set()
+    # The Data API accepts at most 100 values in an $in filter
+    for start in range(0, len(ids), 100):
+        cursor = vector_store.astra_env.collection.find(
+            {"_id": {"$in": ids[start:start + 100]}},
+            projection={"_id": True}
+        )
+        found.update(document["_id"] for document in cursor)
+    return found
+
 def store_in_astra(vector_store: Optional[AstraDBVectorStore], 
                   text: str, 
-                  metadata: dict) -> bool:
-    """Store text in AstraDB"""
+                  metadata: dict,
+                  chunk_size: Optional[int] = None) -> bool:
+    """Store text in AstraDB under content-derived IDs
+
+    Each chunk is stored under :func:`document_id`, so storing the same
+    text again only updates its metadata and skips the embedding.
+    With ``chunk_size`` the text is split into chunks of that many
+    characters; by default it is stored as a single document.
+    """
     try:
         if vector_store is None:
             st.error("AstraDB not initialized")
             return False
 
-        vector_store.add_texts(
-            texts=[text],
-            metadatas=[metadata]
-        )
+        with span("store_in_astra", text_chars=len(text)) as store_span:
+            text_hash = content_hash(text)
+            if chunk_size:
+                splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_size // 10)
+                chunks = splitter.split_text(text)
+            else:
+                chunks = [text]
+            ids = [document_id(text_hash, position, chunk_size) for position in range(len(chunks))]
+            metadatas = [
+                {**metadata, "content_hash": text_hash, "chunk": position, "chunk_size": chunk_size}
+                for position in range(len(chunks))
+            ]
+            
+            # Known content: refresh metadata only, without re-embedding
+            existing = _existing_ids(vector_store, ids)
+            if existing and hasattr(vector_store, 'update_metadata'):
+                vector_store.update_metadata({
+                    doc_id: chunk_metadata
+                    for doc_id, chunk_metadata in zip(ids, metadatas) if doc_id in existing
+                })
+            
+            new = [index for index, doc_id in enumerate(ids) if doc_id not in existing]
+            if new:
+                vector_store.add_texts(
+                    texts=[chunks[index] for index in new],
+                    metadatas=[metadatas[index] for index in new],
+                    ids=[ids[index] for index in new]
+                )
+            store_span.set(
+                chunks=len(ids),
+                skipped=len(existing),
+                embedded_chars=sum(len(chunks[index]) for index in new)
+            )
         return True
     except Exception as e:
         st.error(f"Error storing in AstraDB: {str(e)}")
         return False
 
+def compact_duplicates(vector_store: AstraDBVectorStore,
+                       dry_run: bool = False,
+                       batch_size: int = 20) -> Dict[str, Any]:
+    """Collapse duplicate documents onto their content-derived IDs
+
+    Documents are grouped by content hash, chunk size and chunk position
+    (legacy documents without them are hashed from their content). Each group is
+    kept once under its deterministic ID, reusing a stored vector instead
+    of re-embedding, and every other copy is deleted.
+    """
+    collection = vector_store.astra_env.collection
+    codec = vector_store.document_codec
+    content_field = codec.content_field
+    
+    groups: Dict[str, List[str]] = defaultdict(list)
+    # Content hash, chunk position and chunk size behind each canonical ID
+    keys: Dict[str, Tuple[str, int, Optional[int]]] = {}
+    scanned = 0
+    with span("compact_duplicates.scan") as scan_span:
+        cursor = collection.find(
+            {},
+            projection={"_id": True, content_field: True,
+                        "metadata.content_hash": True, "metadata.chunk": True,
+                        "metadata.chunk_size": True}
+        )
+        for document in cursor:
+            scanned += 1
+            metadata = document.get("metadata") or {}
+            if "content_hash" in metadata:
+                key = (metadata["content_hash"], metadata.get("chunk", 0), metadata.get("chunk_size"))
+            else:
+                key = (content_hash(document.get(content_field) or ""), 0, None)
+            canonical = document_id(*key)
+            keys[canonical] = key
+            groups[canonical].append(document["_id"])
+        scan_span.set(documents=scanned, groups=len(groups))
+    
+    to_delete: List[str] = []
+    migrated = 0
+    with span("compact_duplicates.rewrite") as rewrite_span:
+        for canonical, ids in groups.items():
+            if canonical not in ids:
+                # Re-key one copy under the deterministic ID, keeping its vector
+                migrated += 1
+                if not dry_run:
+                    source = collection.find_one({"_id": ids[0]}, projection=codec.full_projection)
+                    text_hash, position, chunk_size = keys[canonical]
+                    source["metadata"] = {
+                        **(source.get("metadata") or {}),
+                        "content_hash": text_hash,
+                        "chunk": position,
+                        "chunk_size": chunk_size
+                    }
+                    source["_id"] = canonical
+                    collection.replace_one({"_id": canonical}, source, upsert=True)
+            to_delete.extend(doc_id for doc_id in ids if doc_id != canonical)
+        
+        if not dry_run:
+            for start in range(0, len(to_delete), batch_size):
+                collection.delete_many({"_id": {"$in": to_delete[start:start + batch_size]}})
+        rewrite_span.set(migrated=migrated, deleted=len(to_delete))
+    
+    return {
+        "scanned": scanned,
+        "unique": len(groups),
+        "duplicates_removed": len(to_delete) - migrated,
+        "migrated": migrated,
+        "dry_run": dry_run
+    }
+
 def search_astra(vector_store: Optional[AstraDBVectorStore], 
                 query: str, 
                 k: int = 3) -> List:
@@ -59,7 +244,12 @@ def search_astra(vector_store: Optional[AstraDBVectorStore],
         if vector_store is None:
             return []
             
-        results = vector_store.similarity_search(query, k=k)
+        with span("search_astra", k=k, query_chars=len(query)) as search_span:
+            results = vector_store.similarity_search(query, k=k)
+            search_span.set(
+                results=len(results),
+                result_chars=sum(len(doc.page_content) for doc in results)
+            )
         return results
     except Exception as e:
         st.error(f"Error searching AstraDB: {str(e)}")
@@ -0,0 +1,66 @@
+# utils/async_runtime.py
+import queue
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Awaitable, Iterator, Optional
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_loop_lock = threading.Lock()
+
+_DONE = object()
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Process-wide event loop running in a daemon thread, started on first use"""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(
+                target=_loop.run_forever, name="model-event-loop", daemon=True
+            )
+            _loop_thread.start()
+        return _loop
+
+def _check_not_on_loop():
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError("Blocking call made on the shared event loop; await the coroutine instead")
+
+def run_sync(coro: Awaitable, timeout: Optional[float] = None) -> Any:
+    """Run a coroutine on the shared loop and block the calling thread for its result
+
+    The coroutine runs in a copy of the caller's context, so the active trace
+    and span nesting carry over.
+    """
+    loop = get_event_loop()
+    _check_not_on_loop()
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+def iterate_sync(agen: AsyncIterator) -> Iterator:
+    """Consume an async iterator on the shared loop, yielding its items here"""
+    loop = get_event_loop()
+    _check_not_on_loop()
+    items: "queue.Queue" = queue.Queue()
+
+    async def pump():
+        # One task drives the whole iterator, so its context stays consistent
+        try:
+            async for item in agen:
+                items.put((item, None))
+        except Exception as e:
+            items.put((None, e))
+        finally:
+            items.put((_DONE, None))
+
+    future = asyncio.run_coroutine_threadsafe(pump(), loop)
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        # Stop the producer if the consumer stops early
+        future.cancel()
@@ -0,0 +1,286 @@
+# utils/batch_runner.py
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Iterable
+
+from .file_processors import process_image, process_pdf
+from .model_utils import ModelManager, BatchProcessor
+from .astra_utils import store_in_astra, chunk_size_for
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp'}
+PDF_EXTENSIONS = {'.pdf'}
+SUPPORTED_EXTENSIONS = IMAGE_EXTENSIONS | PDF_EXTENSIONS
+
+def collect_inputs(source: str) -> List[Path]:
+    """Collect input files from a directory or a manifest file
+
+    A manifest is either a plain text file with one path per line or a
+    JSONL file whose lines carry a ``path`` key. Relative paths are resolved
+    against the manifest's directory.
+    """
+    source_path = Path(source)
+
+    if source_path.is_dir():
+        return sorted(
+            path for path in source_path.rglob('*')
+            if path.is_file() and path.suffix.lower() in SUPPORTED_EXTENSIONS
+        )
+
+    paths = []
+    with open(source_path, encoding='utf-8') as manifest:
+        for line in manifest:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            entry = json.loads(line)['path'] if line.startswith('{') else line
+            path = Path(entry)
+            if not path.is_absolute():
+                path = source_path.parent / path
+            paths.append(path)
+    return paths
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+class Checkpoint:
+    """Append-only JSONL record of finished items, used to resume runs"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.completed = set()
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as checkpoint_file:
+                for line in checkpoint_file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A run killed mid-write leaves a partial last line
+                        continue
+                    if record.get('status') == 'success':
+                        self.completed.add(record['id'])
+
+    def is_done(self, item_id: str) -> bool:
+        """Check whether an item already finished successfully"""
+        return item_id in self.completed
+
+    def record(self, result: Dict[str, Any]):
+        """Append a finished item to the checkpoint file"""
+        with self._lock:
+            if result.get('status') == 'success':
+                self.completed.add(result['id'])
+            if not self.path:
+                return
+            with open(self.path, 'a', encoding='utf-8') as checkpoint_file:
+                checkpoint_file.write(json.dumps(result, default=str) + '\n')
+                checkpoint_file.flush()
+                os.fsync(checkpoint_file.fileno())
+
+@dataclass
+class RunStats:
+    """Counters and per-stage latencies collected during a run"""
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    latencies: Dict[str, List[float]] = field(
+        default_factory=lambda: {"extract": [], "analyze": [], "store": [], "total": []}
+    )
+
+    def summary(self, wall_time: float) -> Dict[str, Any]:
+        """Build the throughput/latency summary for the run"""
+        processed = self.succeeded + self.failed
+        return {
+            "processed": processed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "wall_time_s": round(wall_time, 3),
+            "throughput_per_s": round(processed / wall_time, 3) if wall_time else 0.0,
+            "latency_s": {
+                stage: {
+                    "p50": round(_percentile(values, 50), 3),
+                    "p95": round(_percentile(values, 95), 3),
+                    "max": round(max(values), 3) if values else 0.0
+                }
+                for stage, values in self.latencies.items()
+            }
+        }
+
+class BatchRunner:
+    """Headless extract -> analyze -> store pipeline for large backfills"""
+
+    def __init__(self,
+                 model_manager: ModelManager,
+                 vector_store: Optional[Any],
+                 model_name: str,
+                 analysis_type: str = "general",
+                 enhancement_type: str = "default",
+                 extract_workers: int = os.cpu_count() or 1,
+                 analyze_workers: int = 4,
+                 checkpoint_path: Optional[str] = None,
+                 max_in_flight: Optional[int] = None):
+        self.model_manager = model_manager
+        self.batch_processor = BatchProcessor(model_manager)
+        self.vector_store = vector_store
+        self.model_name = model_name
+        self.analysis_type = analysis_type
+        self.enhancement_type = enhancement_type
+        self.extract_workers = extract_workers
+        self.analyze_workers = analyze_workers
+        # Files being extracted or waiting for analysis; bounds the extracted text held in memory
+        self.max_in_flight = max_in_flight or extract_workers + 2 * analyze_workers
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.stats = RunStats()
+        self._stats_lock = threading.Lock()
+
+    def _extract(self, path: Path) -> Dict[str, Any]:
+        """Run OCR or PDF extraction for a single file"""
+        started = time.perf_counter()
+        item = {"id": str(path), "filename": path.name, "started": started}
+
+        if path.suffix.lower() in PDF_EXTENSIONS:
+            item["file_type"] = "pdf"
+            item["text"] = process_pdf(str(path), show_ui=False)
+        else:
+            item["file_type"] = "image"
+            text, confidence, stats = process_image(
+                path, self.enhancement_type, show_ui=False
+            )
+            item.update({"text": text, "confidence": confidence, "stats": stats})
+
+        item["extract_s"] = time.perf_counter() - started
+        return item
+
+    def _analyze_and_store(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Analyze extracted text and store it in the vector store"""
+        result = {
+            "id": item["id"],
+            "filename": item["filename"],
+            "file_type": item["file_type"],
+            "model": self.model_name,
+            "confidence": item.get("confidence"),
+            "stats": item.get("stats"),
+            "extract_s": item["extract_s"]
+        }
+
+        if not item.get("text"):
+            result.update({
+                "status": "failed",
+                "error": item.get("stats", {}).get("error", "No text extracted")
+            })
+            return result
+
+        started = time.perf_counter()
+        analyzed = self.batch_processor.process_batch(
+            [{'text': item["text"], 'id': item["id"]}],
+            self.model_name,
+            self.analysis_type,
+            show_ui=False,
+            use_memory=False
+        )[0]
+        result["analyze_s"] = time.perf_counter() - started
+        result["analysis"] = analyzed.get("analysis")
+        result["served_model"] = analyzed.get("served_model")
+
+        if analyzed["status"] != "success":
+            result.update({"status": "failed", "error": analyzed.get("error", "Analysis failed")})
+            return result
+
+        if self.vector_store is not None:
+            started = time.perf_counter()
+            metadata = {
+                "file_type": item["file_type"],
+                "filename": item["filename"],
+                "model_used": self.model_name,
+                "analysis_type": self.analysis_type
+            }
+            if item["file_type"] == "image":
+                metadata.update({"confidence": item["confidence"], "stats": item["stats"]})
+            stored = store_in_astra(self.vector_store, item["text"], metadata,
+                                    chunk_size=chunk_size_for(item["file_type"]))
+            result["store_s"] = time.perf_counter() - started
+            if not stored:
+                result.update({"status": "failed", "error": "Storing in AstraDB failed"})
+                return result
+
+        result["status"] = "success"
+        return result
+
+    def _finish(self, item: Dict[str, Any], result: Dict[str, Any]):
+        """Record a finished item in the checkpoint and run statistics"""
+        result["total_s"] = time.perf_counter() - item["started"]
+        self.checkpoint.record(result)
+
+        with self._stats_lock:
+            if result["status"] == "success":
+                self.stats.succeeded += 1
+            else:
+                self.stats.failed += 1
+            for stage in ("extract", "analyze", "store", "total"):
+                if f"{stage}_s" in result:
+                    self.stats.latencies[stage].append(result[f"{stage}_s"])
+
+    def run(self, paths: Iterable[Path], on_result=None) -> Dict[str, Any]:
+        """Process all paths, skipping ones already in the checkpoint"""
+        started = time.perf_counter()
+        pending = []
+        for path in paths:
+            if self.checkpoint.is_done(str(path)):
+                self.stats.skipped += 1
+            else:
+                pending.append(path)
+
+        # OCR is CPU bound and analysis is network bound, so each stage gets
+        # its own pool and files flow into analysis as soon as they are extracted
+        remaining = iter(pending)
+        extracting, analyzing = {}, {}
+        with ThreadPoolExecutor(self.extract_workers) as extract_pool, \
+                ThreadPoolExecutor(self.analyze_workers) as analyze_pool:
+
+            def refill():
+                # Only start new extractions while few files are in flight
+                while len(extracting) + len(analyzing) < self.max_in_flight:
+                    path = next(remaining, None)
+                    if path is None:
+                        return
+                    extracting[extract_pool.submit(self._extract, path)] = path
+
+            refill()
+            while extracting or analyzing:
+                done, _ = wait([*extracting, *analyzing], return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in extracting:
+                        path = extracting.pop(future)
+                        try:
+                            item = future.result()
+                        except Exception as e:
+                            item = {"id": str(path), "filename": path.name, "file_type": "unknown",
+                                    "started": time.perf_counter(), "extract_s": 0.0,
+                                    "stats": {"error": str(e)}}
+                        analyzing[analyze_pool.submit(self._analyze_and_store, item)] = item
+                        continue
+
+                    # Checkpoint each file as soon as it is done, so a killed run loses nothing finished
+                    item = analyzing.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"id": item["id"], "filename": item["filename"],
+                                  "file_type": item["file_type"], "status": "error", "error": str(e)}
+                    self._finish(item, result)
+                    if on_result:
+                        on_result(result)
+                refill()
+
+        return self.stats.summary(time.perf_counter() - started)
@@ -0,0 +1,226 @@
+# utils/fake_providers.py
+import json
+import time
+import asyncio
+import random
+import threading
+from dataclasses import dataclass
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+from typing import Optional, Dict, Any
+
+@dataclass
+class FakeLatency:
+    """Latency and failure profile for a fake provider"""
+    latency: float = 0.2
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    response_words: int = 60
+
+    def sleep_time(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate
+
+def _fake_answer(prompt: str, words: int) -> str:
+    """Deterministic-looking filler answer of a fixed length"""
+    seed = prompt.split()[:8] or ["empty"]
+    return " ".join(seed[i % len(seed)] for i in range(words))
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+class _FakeGroqHandler(BaseHTTPRequestHandler):
+    """Serves the OpenAI-compatible chat completions endpoint used by Groq"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        profile: FakeLatency = self.server.profile
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.request_count += 1
+
+        time.sleep(profile.sleep_time())
+
+        if profile.should_fail():
+            body = json.dumps({"error": {"message": "Rate limit reached", "type": "rate_limit"}}).encode()
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        prompt = " ".join(str(message.get("content", "")) for message in request.get("messages", []))
+        # Like the real API, stop at max_tokens (counting at least a token per word)
+        answer = _fake_answer(prompt, min(profile.response_words, request.get("max_tokens") or profile.response_words))
+        usage = {
+            "prompt_tokens": _count_tokens(prompt),
+            "completion_tokens": _count_tokens(answer),
+            "total_tokens": _count_tokens(prompt) + _count_tokens(answer)
+        }
+        base = {
+            "id": f"fake-{self.server.request_count}",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "system_fingerprint": "fake"
+        }
+
+        if request.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            words = answer.split(" ")
+            for index, word in enumerate(words):
+                chunk = {
+                    **base,
+                    "object": "chat.completion.chunk",
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"role": "assistant", "content": word + (" " if index < len(words) - 1 else "")},
+                        "finish_reason": None,
+                        "logprobs": None
+                    }]
+                }
+                if index == len(words) - 1:
+                    chunk["choices"][0]["finish_reason"] = "stop"
+                    chunk["x_groq"] = {"id": base["id"], "usage": usage}
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+            return
+
+        body = json.dumps({
+            **base,
+            "object": "chat.completion",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+                "logprobs": None
+            }],
+            "usage": usage
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+class FakeLLMServer:
+    """Local Groq-compatible HTTP server with configurable latency
+
+    Point ``ChatGroq`` at it by setting ``GROQ_API_BASE`` to :attr:`url`
+    (see :meth:`install`).
+    """
+
+    def __init__(self, profile: Optional[FakeLatency] = None, port: int = 0):
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _FakeGroqHandler)
+        self._server.daemon_threads = True
+        self._server.profile = profile or FakeLatency()
+        self._server.request_count = 0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def profile(self) -> FakeLatency:
+        return self._server.profile
+
+    @property
+    def request_count(self) -> int:
+        return self._server.request_count
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def install(self, environ: Optional[Dict[str, str]] = None):
+        """Route Groq clients created from the environment to this server"""
+        import os
+        environ = os.environ if environ is None else environ
+        environ["GROQ_API_BASE"] = self.url
+        environ.setdefault("GROQ_API_KEY", "fake-key")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class FakeGeminiModel:
+    """Stand-in for ``genai.GenerativeModel`` with configurable latency"""
+
+    def __init__(self, model_name: str, profile: FakeLatency, generation_config: Optional[Dict[str, Any]] = None):
+        self.model_name = model_name
+        self.profile = profile
+        self.max_output_tokens = (generation_config or {}).get("max_output_tokens")
+
+    def _respond(self, contents: Any) -> SimpleNamespace:
+        parts = contents if isinstance(contents, list) else [contents]
+        prompt = " ".join(part for part in parts if isinstance(part, str))
+        if self.profile.should_fail():
+            raise RuntimeError("429 Resource has been exhausted")
+        answer = _fake_answer(prompt, min(self.profile.response_words,
+                                          self.max_output_tokens or self.profile.response_words))
+        return SimpleNamespace(
+            text=answer,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=_count_tokens(prompt),
+                candidates_token_count=_count_tokens(answer),
+                total_token_count=_count_tokens(prompt) + _count_tokens(answer)
+            )
+        )
+
+    def generate_content(self, contents: Any, **kwargs) -> SimpleNamespace:
+        time.sleep(self.profile.sleep_time())
+        return self._respond(contents)
+
+    async def generate_content_async(self, contents: Any, stream: bool = False, **kwargs) -> Any:
+        await asyncio.sleep(self.profile.sleep_time())
+        response = self._respond(contents)
+        if stream:
+            return _FakeAsyncStream(response)
+        return response
+
+class _FakeAsyncStream:
+    """Async iterable of word chunks, like a streamed Gemini response"""
+
+    def __init__(self, response: SimpleNamespace):
+        self.usage_metadata = response.usage_metadata
+        self._words = response.text.split(" ")
+
+    async def __aiter__(self):
+        for index, word in enumerate(self._words):
+            await asyncio.sleep(0)
+            yield SimpleNamespace(text=word + (" " if index < len(self._words) - 1 else ""))
+
+class FakeGenAI:
+    """Stand-in for the ``google.generativeai`` module used by ModelManager
+
+    Install with ``model_manager.clients["google"] = FakeGenAI(profile)``.
+    """
+
+    def __init__(self, profile: Optional[FakeLatency] = None):
+        self.profile = profile or FakeLatency()
+
+    def GenerativeModel(self, model_name: str, generation_config: Optional[Dict[str, Any]] = None,
+                        **kwargs) -> FakeGeminiModel:
+        return FakeGeminiModel(model_name, self.profile, generation_config)
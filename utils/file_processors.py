@@ -4,12 +4,16 @@ from PIL import Image
 import pytesseract
 import cv2
 import numpy as np
+import io
 import os
-from typing import Optional, Tuple, Dict
-import tempfile
+import time
+from typing import Optional, Tuple, Dict, Any, Callable
 from pypdf import PdfReader
 import warnings
 
+from .tracing import span
+from .uploads import reserve, spooled_path, open_readable, image_working_bytes
+
 
 warnings.filterwarnings('ignore', category=UserWarning)
 
@@ -19,147 +23,271 @@ warnings.filterwarnings('ignore', message='.*torch.classes.*')
 TESSERACT_PATH = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH
 
+# Longest side (in pixels) of the previews sent to the browser
+PREVIEW_MAX_SIDE = 640
+
+def _to_gray(image: np.ndarray) -> np.ndarray:
+    """Return a single-channel view of a BGR or already-gray image"""
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+def _upload_buffer(source: Any) -> np.ndarray:
+    """Wrap the bytes of an upload or file-like object without copying them"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return np.frombuffer(source, dtype=np.uint8)
+    if hasattr(source, 'getbuffer'):
+        # Streamlit uploads are BytesIO objects, so this is a view over their buffer
+        return np.frombuffer(source.getbuffer(), dtype=np.uint8)
+    source.seek(0)
+    return np.frombuffer(source.read(), dtype=np.uint8)
+
+def _as_file(source: Any) -> Any:
+    """File-like view of raw upload bytes, for readers that need one (PIL)"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return source
+
+def load_image_gray(source: Any) -> np.ndarray:
+    """Decode a path, upload, PIL image or array straight to an 8-bit grayscale array"""
+    if isinstance(source, np.ndarray):
+        return _to_gray(source)
+    
+    if isinstance(source, (str, os.PathLike)):
+        gray = cv2.imread(os.fspath(source), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError(f"Could not decode image: {source}")
+        return gray
+    
+    if isinstance(source, Image.Image):
+        # Let PIL do the luma conversion so no full-size RGB array is created
+        if source.mode != 'L':
+            source = source.convert('L')
+        return np.asarray(source)
+    
+    gray = cv2.imdecode(_upload_buffer(source), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        # Formats OpenCV cannot decode still go through PIL
+        source = _as_file(source)
+        source.seek(0)
+        with Image.open(source) as image:
+            gray = np.asarray(image.convert('L'))
+    return gray
+
+def make_preview(source: Any, max_side: int = PREVIEW_MAX_SIDE) -> np.ndarray:
+    """Build a small preview thumbnail for display in the browser"""
+    if isinstance(source, np.ndarray):
+        height, width = source.shape[:2]
+        scale = max_side / max(height, width)
+        if scale >= 1:
+            return source
+        return cv2.resize(
+            source,
+            (max(1, int(width * scale)), max(1, int(height * scale))),
+            interpolation=cv2.INTER_AREA
+        )
+    
+    if isinstance(source, Image.Image):
+        preview = source.copy()
+    else:
+        source = _as_file(source)
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        preview = Image.open(source)
+        # JPEG decoders can skip straight to a reduced scale
+        preview.draft('RGB', (max_side, max_side))
+    preview.thumbnail((max_side, max_side))
+    return np.asarray(preview.convert('RGB'))
+
 def enhance_image(image: np.ndarray, enhancement_type: str = 'default') -> np.ndarray:
     """Enhanced image preprocessing with multiple options"""
-    if enhancement_type == 'document':
-        # Optimize for document scanning
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        denoised = cv2.fastNlMeansDenoising(gray)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        enhanced = clahe.apply(denoised)
-        thresh = cv2.adaptiveThreshold(
-            enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY, 11, 2
-        )
-        return thresh
+    with span("enhance_image", mode=enhancement_type, image_bytes=image.nbytes):
+        if enhancement_type == 'document':
+            # Optimize for document scanning
+            gray = _to_gray(image)
+            denoised = cv2.fastNlMeansDenoising(gray)
+            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+            enhanced = clahe.apply(denoised)
+            thresh = cv2.adaptiveThreshold(
+                enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                cv2.THRESH_BINARY, 11, 2
+            )
+            return thresh
         
-    elif enhancement_type == 'handwriting':
-        # Optimize for handwritten text
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-        enhanced = clahe.apply(gray)
-        bilateral = cv2.bilateralFilter(enhanced, 9, 75, 75)
-        thresh = cv2.adaptiveThreshold(
-            bilateral, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY, 11, 2
-        )
-        return thresh
+        elif enhancement_type == 'handwriting':
+            # Optimize for handwritten text
+            gray = _to_gray(image)
+            clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+            enhanced = clahe.apply(gray)
+            bilateral = cv2.bilateralFilter(enhanced, 9, 75, 75)
+            thresh = cv2.adaptiveThreshold(
+                bilateral, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                cv2.THRESH_BINARY, 11, 2
+            )
+            return thresh
         
-    else:
-        # Default enhancement
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        denoised = cv2.fastNlMeansDenoising(gray)
-        thresh = cv2.adaptiveThreshold(
-            denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY, 11, 2
-        )
-        return thresh
+        else:
+            # Default enhancement
+            gray = _to_gray(image)
+            denoised = cv2.fastNlMeansDenoising(gray)
+            thresh = cv2.adaptiveThreshold(
+                denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                cv2.THRESH_BINARY, 11, 2
+            )
+            return thresh
+
+def process_image(image: Any,
+                  enhancement_type: str = 'default',
+                  show_ui: bool = True) -> Tuple[Optional[str], float, Dict]:
+    """Process image with OCR and return text, confidence, and stats
 
-def process_image(image: Image.Image, enhancement_type: str = 'default') -> Tuple[Optional[str], float, Dict]:
-    """Process image with OCR and return text, confidence, and stats"""
+    ``image`` may be a path, an upload/file-like object, a PIL image or an
+    array. Pass ``show_ui=False`` to run without any Streamlit output.
+    """
     try:
-        # Convert PIL Image to CV2 format
-        cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        
-        # Show preprocessing steps
-        with st.expander("View Processing Steps"):
-            col1, col2 = st.columns(2)
-            with col1:
-                st.image(cv_image, caption="Original Image")
+        # Count the decoded frames, not just the compressed upload, against the
+        # process budget until OCR is done
+        with reserve(image, nbytes=image_working_bytes(image)) as working_bytes:
+            # Decode once, straight to grayscale
+            with span("load_image_gray") as decode_span:
+                gray = load_image_gray(image)
+                decode_span.set(image_bytes=gray.nbytes)
             
             # Enhance image
-            processed = enhance_image(cv_image, enhancement_type)
-            with col2:
-                st.image(processed, caption=f"Enhanced ({enhancement_type})")
-        
-        # Perform OCR
-        data = pytesseract.image_to_data(
-            processed, output_type=pytesseract.Output.DICT
-        )
-        
-        # Calculate confidence
-        confidences = [int(conf) for conf in data['conf'] if conf != '-1']
-        avg_confidence = sum(confidences) / len(confidences) if confidences else 0
-        
-        # Extract text
-        text = pytesseract.image_to_string(processed)
-        
-        if text.strip():
-            st.success(f"Text extracted with {avg_confidence:.2f}% confidence")
+            processed = enhance_image(gray, enhancement_type)
             
-            # Show OCR details
-            with st.expander("OCR Details"):
-                st.json({
-                    "confidence": avg_confidence,
-                    "word_count": len(data['text']),
-                    "enhancement_type": enhancement_type
-                })
+            # Show preprocessing steps as thumbnails rather than full-size frames
+            preview_bytes = 0
+            if show_ui:
+                # The original is previewed in colour; only OCR works in grayscale
+                if isinstance(image, np.ndarray) and image.ndim == 3:
+                    original_preview = cv2.cvtColor(make_preview(image), cv2.COLOR_BGR2RGB)
+                else:
+                    original_preview = make_preview(image)
+                enhanced_preview = make_preview(processed)
+                preview_bytes = original_preview.nbytes + enhanced_preview.nbytes
+                with st.expander("View Processing Steps"):
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        st.image(original_preview, caption="Original Image")
+                    with col2:
+                        st.image(enhanced_preview, caption=f"Enhanced ({enhancement_type})")
+            
+            # Perform OCR
+            with span("tesseract.image_to_data", image_bytes=processed.nbytes):
+                data = pytesseract.image_to_data(
+                    processed, output_type=pytesseract.Output.DICT
+                )
+            
+            # Calculate confidence
+            confidences = [int(conf) for conf in data['conf'] if conf != '-1']
+            avg_confidence = sum(confidences) / len(confidences) if confidences else 0
+            
+            # Extract text
+            with span("tesseract.image_to_string", image_bytes=processed.nbytes) as ocr_span:
+                text = pytesseract.image_to_string(processed)
+                ocr_span.set(text_chars=len(text))
             
-            return text.strip(), avg_confidence, {
-                "confidence": avg_confidence,
-                "word_count": len(data['text']),
-                "enhancement_type": enhancement_type
+            # Size of one decoded frame, the estimated peak reserved for OCR
+            # (upload plus all working frames), and bytes sent as previews
+            memory_stats = {
+                "frame_bytes": gray.nbytes,
+                "working_bytes": working_bytes,
+                "preview_bytes": preview_bytes
             }
-        else:
-            st.warning("No text detected in image")
-            return None, 0.0, {"error": "No text detected"}
             
+            if text.strip():
+                stats = {
+                    "confidence": avg_confidence,
+                    "word_count": len(data['text']),
+                    "enhancement_type": enhancement_type,
+                    **memory_stats
+                }
+                
+                if show_ui:
+                    st.success(f"Text extracted with {avg_confidence:.2f}% confidence")
+                    
+                    # Show OCR details
+                    with st.expander("OCR Details"):
+                        st.json(stats)
+                
+                return text.strip(), avg_confidence, stats
+            else:
+                if show_ui:
+                    st.warning("No text detected in image")
+                return None, 0.0, {"error": "No text detected", **memory_stats}
+                
     except Exception as e:
-        st.error(f"Error processing image: {str(e)}")
+        if show_ui:
+            st.error(f"Error processing image: {str(e)}")
         return None, 0.0, {"error": str(e)}
 
-def process_pdf(pdf_file) -> Optional[str]:
-    """Process PDF and extract text"""
+def process_pdf(pdf_file,
+                show_ui: bool = True,
+                on_progress: Optional[Callable[[float], None]] = None) -> Optional[str]:
+    """Process PDF and extract text
+
+    ``on_progress`` is called with the fraction of pages done after each page.
+    """
     try:
-        reader = PdfReader(pdf_file)
-        text = ""
-        
-        # Show progress
-        progress_bar = st.progress(0)
-        for i, page in enumerate(reader.pages):
-            text += page.extract_text()
-            progress_bar.progress((i + 1) / len(reader.pages))
-        
-        if not text.strip():
-            st.warning("No text extracted from PDF")
-            return None
+        # Files are memory-mapped rather than read into memory
+        with open_readable(pdf_file) as stream:
+            reader = PdfReader(stream)
+            text = ""
             
-        st.success("PDF processed successfully!")
-        return text
+            # Show progress
+            progress_bar = st.progress(0) if show_ui else None
+            for i, page in enumerate(reader.pages):
+                with span("process_pdf.page", page=i) as page_span:
+                    page_text = page.extract_text()
+                    page_span.set(text_chars=len(page_text))
+                text += page_text
+                if progress_bar:
+                    progress_bar.progress((i + 1) / len(reader.pages))
+                if on_progress:
+                    on_progress((i + 1) / len(reader.pages))
+            
+            if not text.strip():
+                if show_ui:
+                    st.warning("No text extracted from PDF")
+                return None
+            
+            if show_ui:
+                st.success("PDF processed successfully!")
+            return text
     except Exception as e:
-        st.error(f"Error processing PDF: {str(e)}")
+        if show_ui:
+            st.error(f"Error processing PDF: {str(e)}")
         return None
 
-def process_video(video_file) -> Optional[str]:
+def process_video(video_file, show_ui: bool = True) -> Optional[str]:
     """Process video and extract information"""
     try:
         import moviepy.editor as mp
         
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp_file:
-            tmp_file.write(video_file.read())
-            video_path = tmp_file.name
-
-        # Process video
-        with mp.VideoFileClip(video_path) as video:
-            # Get video information
-            info = {
-                "duration": video.duration,
-                "fps": video.fps,
-                "size": video.size,
-                "has_audio": video.audio is not None
-            }
-            
-            # Display video information
-            st.subheader("Video Information:")
-            for key, value in info.items():
-                st.write(f"**{key.replace('_', ' ').title()}:** {value}")
-        
-        # Clean up
-        os.unlink(video_path)
+        # Spooled to disk in chunks; the temp file is removed even if moviepy fails
+        suffix = os.path.splitext(getattr(video_file, 'name', '') or '')[1] or '.mp4'
+        with spooled_path(video_file, suffix=suffix) as video_path:
+            # Process video
+            with mp.VideoFileClip(video_path) as video:
+                # Get video information
+                info = {
+                    "duration": video.duration,
+                    "fps": video.fps,
+                    "size": video.size,
+                    "has_audio": video.audio is not None
+                }
+                
+                # Display video information
+                if show_ui:
+                    st.subheader("Video Information:")
+                    for key, value in info.items():
+                        st.write(f"**{key.replace('_', ' ').title()}:** {value}")
         
         return f"Video processed successfully. Duration: {info['duration']} seconds"
     except Exception as e:
-        st.error(f"Error processing video: {str(e)}")
+        if show_ui:
+            st.error(f"Error processing video: {str(e)}")
         return None
 
 def process_batch_images(images: list) -> list:
@@ -169,6 +297,7 @@ def process_batch_images(images: list) -> list:
     status_text = st.empty()
     
     for idx, img_data in enumerate(images):
+        started = time.perf_counter()
         try:
             status_text.text(f"Processing image {idx + 1}/{len(images)}: {img_data['name']}")
             
@@ -182,7 +311,8 @@ def process_batch_images(images: list) -> list:
                 'filename': img_data['name'],
                 'text': text,
                 'confidence': confidence,
-                'stats': stats
+                'stats': stats,
+                'ocr_s': round(time.perf_counter() - started, 4)
             })
             
             # Update progress
@@ -191,7 +321,8 @@ def process_batch_images(images: list) -> list:
         except Exception as e:
             results.append({
                 'filename': img_data['name'],
-                'error': str(e)
+                'error': str(e),
+                'ocr_s': round(time.perf_counter() - started, 4)
             })
     
     status_text.text("Batch processing complete!")
@@ -0,0 +1,364 @@
+# utils/job_queue.py
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import multiprocessing
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Callable
+
+from .uploads import copy_upload
+
+JOBS_DIR = os.getenv("JOBS_DIR", ".jobs")
+DEFAULT_DB_PATH = os.path.join(JOBS_DIR, "jobs.sqlite3")
+UPLOADS_DIR = os.path.join(JOBS_DIR, "uploads")
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+class JobCancelled(Exception):
+    """Raised inside a worker when the running job was cancelled"""
+
+class JobQueue:
+    """SQLite-backed job queue shared by the Streamlit app and worker processes"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Open a short-lived connection; each process/thread gets its own"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_dict(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> str:
+        """Queue a job and return its id"""
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(payload), time.time())
+            )
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest queued job, or return None"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, started_at = ? WHERE id = ?",
+                (worker_id, time.time(), row["id"])
+            )
+            conn.execute("COMMIT")
+            return self.get(row["id"])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch a single job"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def list_jobs(self, job_ids: Optional[List[str]] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """List the given jobs, or the most recent ones, newest first"""
+        with self._connect() as conn:
+            if job_ids is not None:
+                if not job_ids:
+                    return []
+                placeholders = ",".join("?" * len(job_ids))
+                rows = conn.execute(
+                    f"SELECT * FROM jobs WHERE id IN ({placeholders}) ORDER BY created_at DESC",
+                    list(job_ids)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+                ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def set_progress(self, job_id: str, progress: float):
+        """Update progress; raises JobCancelled if cancellation was requested"""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (progress, job_id))
+        self.check_cancelled(job_id)
+
+    def check_cancelled(self, job_id: str):
+        """Raise JobCancelled if cancellation of the job was requested"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row and row["cancel_requested"]:
+            raise JobCancelled(job_id)
+
+    def complete(self, job_id: str, result: Dict[str, Any]):
+        """Mark a job as succeeded and store its result"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'succeeded', progress = 1, result = ?, finished_at = ? WHERE id = ?",
+                (json.dumps(result, default=str), time.time(), job_id)
+            )
+
+    def fail(self, job_id: str, error: str, status: str = "failed"):
+        """Mark a job as failed (or cancelled)"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id)
+            )
+
+    def cancel(self, job_id: str):
+        """Cancel a queued job immediately or ask a running one to stop"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'",
+                (job_id,)
+            )
+            conn.execute("COMMIT")
+
+    def requeue_stale(self):
+        """Put running jobs whose worker process has died back in the queue
+
+        Workers are identified by pid, so this assumes all workers share
+        this host.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, worker FROM jobs WHERE status = 'running'"
+            ).fetchall()
+            for row in rows:
+                if not _pid_alive(int(row["worker"] or 0)):
+                    conn.execute(
+                        "UPDATE jobs SET status = 'queued', worker = NULL, progress = 0 "
+                        "WHERE id = ? AND status = 'running'",
+                        (row["id"],)
+                    )
+
+def _pid_alive(pid: int) -> bool:
+    """Check whether a local process is still running"""
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def save_upload(uploaded_file) -> str:
+    """Copy an upload to the jobs directory so worker processes can read it"""
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    path = os.path.join(UPLOADS_DIR, f"{uuid.uuid4().hex}_{os.path.basename(uploaded_file.name)}")
+    with open(path, "wb") as target:
+        copy_upload(uploaded_file, target)
+    return path
+
+class _WorkerContext:
+    """Per-process model and vector store clients, created on first use"""
+
+    def __init__(self):
+        self._model_manager = None
+        self._vector_store = None
+
+    @property
+    def model_manager(self):
+        if self._model_manager is None:
+            from .model_utils import ModelManager
+            self._model_manager = ModelManager()
+        return self._model_manager
+
+    @property
+    def vector_store(self):
+        if self._vector_store is None:
+            from .astra_utils import initialize_embeddings, initialize_astra
+            embeddings = initialize_embeddings()
+            self._vector_store = initialize_astra(embeddings) if embeddings else None
+        return self._vector_store
+
+def _analyze_and_store(queue: JobQueue,
+                       job: Dict[str, Any],
+                       context: _WorkerContext,
+                       text: str,
+                       metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Shared analysis/storage tail of the image and PDF jobs
+
+    Cancellation is checked before each model call and before storing, so
+    a cancelled job does not start another long step.
+    """
+    from .astra_utils import store_in_astra, chunk_size_for
+
+    payload = job["payload"]
+    result = {"text": text}
+    if payload.get("model_name"):
+        queue.check_cancelled(job["id"])
+        model_manager = context.model_manager
+        if model_manager.needs_map_reduce(text, payload["model_name"], payload.get("analysis_type", "general")):
+            analyze = model_manager.analyze_long_content
+        else:
+            analyze = model_manager.analyze_content
+        analysis = analyze(
+            {'text': text},
+            payload["model_name"],
+            payload.get("analysis_type", "general"),
+            use_memory=False
+        )
+        if not analysis:
+            raise RuntimeError(f"Analysis with {payload['model_name']} failed")
+        result["analysis"] = analysis["analysis"]
+
+    if payload.get("store"):
+        queue.check_cancelled(job["id"])
+        metadata = {
+            **metadata,
+            "model_used": payload.get("model_name"),
+            "analysis_type": payload.get("analysis_type", "general")
+        }
+        result["stored"] = store_in_astra(context.vector_store, text, metadata,
+                                          chunk_size=chunk_size_for(metadata.get("file_type")))
+    return result
+
+def _run_image_job(queue: JobQueue, job: Dict[str, Any], context: _WorkerContext) -> Dict[str, Any]:
+    from .file_processors import process_image
+
+    payload = job["payload"]
+    queue.check_cancelled(job["id"])
+    text, confidence, stats = process_image(
+        payload["path"], payload.get("enhancement_type", "default"), show_ui=False
+    )
+    if not text:
+        raise RuntimeError(stats.get("error", "No text detected"))
+    queue.set_progress(job["id"], 0.5)
+
+    result = _analyze_and_store(queue, job, context, text, {
+        "file_type": "image",
+        "filename": payload["filename"],
+        "confidence": confidence,
+        "stats": stats
+    })
+    result.update({"confidence": confidence, "stats": stats})
+    return result
+
+def _run_pdf_job(queue: JobQueue, job: Dict[str, Any], context: _WorkerContext) -> Dict[str, Any]:
+    from .file_processors import process_pdf
+
+    payload = job["payload"]
+    text = process_pdf(
+        payload["path"],
+        show_ui=False,
+        on_progress=lambda fraction: queue.set_progress(job["id"], 0.5 * fraction)
+    )
+    if not text:
+        raise RuntimeError("No text extracted from PDF")
+
+    return _analyze_and_store(queue, job, context, text, {
+        "file_type": "pdf",
+        "filename": payload["filename"]
+    })
+
+def _run_video_job(queue: JobQueue, job: Dict[str, Any], context: _WorkerContext) -> Dict[str, Any]:
+    from .file_processors import process_video
+
+    queue.check_cancelled(job["id"])
+    with open(job["payload"]["path"], "rb") as video_file:
+        message = process_video(video_file, show_ui=False)
+    if not message:
+        raise RuntimeError("Video processing failed")
+    return {"message": message}
+
+JOB_HANDLERS: Dict[str, Callable[[JobQueue, Dict[str, Any], _WorkerContext], Dict[str, Any]]] = {
+    "image": _run_image_job,
+    "pdf": _run_pdf_job,
+    "video": _run_video_job
+}
+
+def run_worker(db_path: str = DEFAULT_DB_PATH, poll_interval: float = 0.5, max_jobs: Optional[int] = None):
+    """Claim and execute jobs until stopped (or ``max_jobs`` jobs are done)"""
+    # Streamlit calls inside the utils are no-ops here; silence their warnings
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    queue = JobQueue(db_path)
+    context = _WorkerContext()
+    worker_id = str(os.getpid())
+    done = 0
+
+    while max_jobs is None or done < max_jobs:
+        job = queue.claim(worker_id)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        try:
+            handler = JOB_HANDLERS.get(job["kind"])
+            if handler is None:
+                raise ValueError(f"Unknown job kind: {job['kind']}")
+            result = handler(queue, job, context)
+            # Last chance to honour a cancellation before the result is published
+            queue.set_progress(job["id"], 1.0)
+            queue.complete(job["id"], result)
+        except JobCancelled:
+            queue.fail(job["id"], "Cancelled by user", status="cancelled")
+        except Exception as e:
+            queue.fail(job["id"], str(e))
+        finally:
+            done += 1
+            if job["payload"].get("cleanup") and os.path.exists(job["payload"]["path"]):
+                os.unlink(job["payload"]["path"])
+
+def start_workers(count: int, db_path: str = DEFAULT_DB_PATH) -> List[multiprocessing.Process]:
+    """Start ``count`` worker processes that exit with the parent"""
+    # Spawn rather than fork: the parent may hold threads and open clients
+    ctx = multiprocessing.get_context("spawn")
+    workers = []
+    for _ in range(count):
+        process = ctx.Process(target=run_worker, args=(db_path,), daemon=True)
+        process.start()
+        workers.append(process)
+    return workers
@@ -0,0 +1,333 @@
+# utils/memory.py
+import os
+import sys
+import hmac
+import time
+import logging
+import threading
+import tracemalloc
+from collections import deque
+from typing import Optional, Dict, Any, List
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from .tracing import metrics
+
+# Seconds between background memory snapshots
+SNAPSHOT_INTERVAL = float(os.getenv("MEMORY_SNAPSHOT_INTERVAL", "60"))
+
+# Trace allocations from startup (slower; also possible from the debug panel)
+TRACEMALLOC_ENABLED = os.getenv("MEMORY_TRACEMALLOC", "").lower() in ("1", "true", "yes")
+
+# Stack frames kept per traced allocation
+TRACEMALLOC_FRAMES = int(os.getenv("MEMORY_TRACEMALLOC_FRAMES", "1"))
+
+# Snapshots kept for the trend (6 hours at the default interval)
+HISTORY = 360
+
+# History needed before a growth rate is reported, so startup does not dominate it
+MIN_TREND_SECONDS = 600
+
+# Sessions not seen for this long are dropped from the accounting
+SESSION_TTL = 3600
+
+# Token that unlocks the memory panel when passed as ?admin=<token>; unset disables it
+ADMIN_TOKEN = os.getenv("MEMORY_ADMIN_TOKEN", "")
+
+# Objects visited per deep_sizeof call, so a huge structure cannot stall a rerun
+MAX_OBJECTS = 200_000
+
+logger = logging.getLogger("chatbot.memory")
+
+# Allocations made by the tracer and the import system are noise here
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>")
+]
+
+def rss_bytes() -> int:
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak rather than current RSS, where /proc is unavailable
+        import resource
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+def deep_sizeof(obj: Any, max_objects: int = MAX_OBJECTS) -> int:
+    """Approximate bytes held by an object and everything it references
+
+    Arrays and images count their pixel buffers. Modules, classes and
+    functions are not followed, since they are shared by the whole process.
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack and len(seen) < max_objects:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, (type, type(sys), type(deep_sizeof))):
+            continue
+        seen.add(id(current))
+        try:
+            total += sys.getsizeof(current)
+        except TypeError:
+            continue
+
+        if hasattr(current, 'nbytes') and hasattr(current, 'dtype'):
+            # numpy arrays that are views do not include their buffer in getsizeof
+            if getattr(current, 'base', None) is not None:
+                total += current.nbytes
+            continue
+        if hasattr(current, 'getbands') and hasattr(current, 'size'):
+            # PIL images keep pixels outside the Python object
+            width, height = current.size
+            total += width * height * len(current.getbands())
+            continue
+        if isinstance(current, (str, bytes, bytearray, int, float, bool)) or current is None:
+            continue
+
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            stack.extend(current)
+        else:
+            if hasattr(current, '__dict__'):
+                stack.append(vars(current))
+            for slot in getattr(type(current), '__slots__', ()):
+                if hasattr(current, slot):
+                    stack.append(getattr(current, slot))
+    return total
+
+def session_state_sizes(state: Any) -> Dict[str, int]:
+    """Approximate bytes held by each session state entry"""
+    sizes = {}
+    for key in list(state.keys()):
+        try:
+            sizes[str(key)] = deep_sizeof(state[key])
+        except Exception as e:
+            logger.debug("Could not size session state key %s: %s", key, e)
+    return sizes
+
+class MemoryMonitor:
+    """Process-wide RSS and tracemalloc snapshots taken on a background thread
+
+    Also keeps the latest session state size reported by each session, so
+    the debug panel of any session can show all of them.
+    """
+
+    _shared: Optional["MemoryMonitor"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, interval: float = SNAPSHOT_INTERVAL, history: int = HISTORY):
+        self.interval = interval
+        self.samples = deque(maxlen=history)
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._latest: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def shared(cls) -> "MemoryMonitor":
+        """The monitor for this process, started on first use"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+                if TRACEMALLOC_ENABLED:
+                    cls._shared.start_tracing()
+                cls._shared.start()
+            return cls._shared
+
+    def start(self) -> "MemoryMonitor":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="memory-monitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                logger.warning("Memory snapshot failed: %s", e)
+            self._stop.wait(self.interval)
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start_tracing(self, frames: int = TRACEMALLOC_FRAMES):
+        """Start tracing allocations; growth is reported against this point"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.reset_baseline()
+
+    def stop_tracing(self):
+        tracemalloc.stop()
+        with self._lock:
+            self._baseline = self._latest = None
+
+    def reset_baseline(self):
+        """Report allocation growth from now on"""
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+            with self._lock:
+                self._baseline = self._latest = snapshot
+
+    def sample(self) -> Dict[str, Any]:
+        """Take a snapshot now and add it to the history"""
+        sample = {"time": time.time(), "rss_bytes": rss_bytes()}
+        if tracemalloc.is_tracing():
+            sample["traced_bytes"], sample["traced_peak_bytes"] = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+            with self._lock:
+                self._latest = snapshot
+                if self._baseline is None:
+                    self._baseline = snapshot
+        with self._lock:
+            self.samples.append(sample)
+            session_bytes = sum(session["total_bytes"] for session in self.sessions.values())
+
+        metrics.set_gauge("chatbot_process_resident_bytes", sample["rss_bytes"],
+                          "Resident set size of the app process")
+        metrics.set_gauge("chatbot_session_state_bytes", session_bytes,
+                          "Approximate session state size summed over live sessions")
+        if "traced_bytes" in sample:
+            metrics.set_gauge("chatbot_tracemalloc_traced_bytes", sample["traced_bytes"],
+                              "Python heap allocations traced by tracemalloc")
+        return sample
+
+    def growth_per_hour(self) -> Optional[float]:
+        """RSS growth in bytes per hour across the kept history"""
+        with self._lock:
+            if len(self.samples) < 2:
+                return None
+            first, last = self.samples[0], self.samples[-1]
+        elapsed = last["time"] - first["time"]
+        if elapsed < MIN_TREND_SECONDS:
+            return None
+        return (last["rss_bytes"] - first["rss_bytes"]) / elapsed * 3600
+
+    def top_allocations(self, limit: int = 15, group_by: str = "lineno") -> List[Dict[str, Any]]:
+        """Allocation sites that grew most since the baseline"""
+        with self._lock:
+            baseline, latest = self._baseline, self._latest
+        if latest is None:
+            return []
+        rows = []
+        for stat in latest.compare_to(baseline, group_by)[:limit]:
+            frame = stat.traceback[0]
+            rows.append({
+                "site": f"{frame.filename}:{frame.lineno}",
+                "size_kb": round(stat.size / 1024, 1),
+                "growth_kb": round(stat.size_diff / 1024, 1),
+                "count": stat.count,
+                "count_growth": stat.count_diff
+            })
+        return rows
+
+    def record_session(self, session_id: str, sizes: Dict[str, int]):
+        """Store the latest session state sizes of one session"""
+        now = time.time()
+        with self._lock:
+            self.sessions[session_id] = {
+                "updated": now,
+                "total_bytes": sum(sizes.values()),
+                "keys": sizes
+            }
+            for stale in [key for key, session in self.sessions.items() if now - session["updated"] > SESSION_TTL]:
+                del self.sessions[stale]
+
+    def recent_sizes(self, session_id: str, max_age: float) -> Optional[Dict[str, int]]:
+        """Sizes a session reported within ``max_age`` seconds, if any"""
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session and time.time() - session["updated"] < max_age:
+                return session["keys"]
+        return None
+
+    def session_rows(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            sessions = list(self.sessions.items())
+        return sorted(
+            (
+                {
+                    "session": session_id[:8],
+                    "state_kb": round(session["total_bytes"] / 1024, 1),
+                    "largest_key": max(session["keys"], key=session["keys"].get, default=""),
+                    "idle_s": round(time.time() - session["updated"])
+                }
+                for session_id, session in sessions
+            ),
+            key=lambda row: -row["state_kb"]
+        )
+
+def record_session_state(monitor: MemoryMonitor, force: bool = False) -> Dict[str, int]:
+    """Account the current session's state with the monitor; call once per rerun
+
+    Sizing walks the whole session state, so each session is measured at
+    most once per snapshot interval; in between the last sizes are returned.
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    session_id = ctx.session_id if ctx else "local"
+    if not force:
+        recent = monitor.recent_sizes(session_id, monitor.interval)
+        if recent is not None:
+            return recent
+    sizes = session_state_sizes(st.session_state)
+    monitor.record_session(session_id, sizes)
+    return sizes
+
+def is_memory_admin() -> bool:
+    """Whether this session may see the process-wide memory panel"""
+    if not ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest(st.query_params.get("admin", ""), ADMIN_TOKEN)
+
+def render_memory_panel(monitor: MemoryMonitor, sizes: Dict[str, int]):
+    """Show process memory, session state sizes and top allocation sites"""
+    with st.expander("Debug: memory"):
+        sample = monitor.sample()
+        growth = monitor.growth_per_hour()
+        col1, col2 = st.columns(2)
+        col1.metric("RSS", f"{sample['rss_bytes'] / 2 ** 20:.0f} MB")
+        col2.metric("Growth", f"{growth / 2 ** 20:+.1f} MB/h" if growth is not None else "n/a")
+        if len(monitor.samples) > 1:
+            st.line_chart([
+                {"rss_mb": round(s["rss_bytes"] / 2 ** 20, 1)} for s in monitor.samples
+            ], y="rss_mb", height=120)
+
+        st.caption(f"This session's state: {sum(sizes.values()) / 1024:.1f} KB")
+        st.dataframe(
+            sorted(({"key": key, "kb": round(size / 1024, 1)} for key, size in sizes.items()),
+                   key=lambda row: -row["kb"]),
+            hide_index=True, use_container_width=True
+        )
+        st.caption("All sessions")
+        st.dataframe(monitor.session_rows(), hide_index=True, use_container_width=True)
+
+        if not monitor.tracing:
+            st.caption("Allocation tracing is off (set MEMORY_TRACEMALLOC=1 to trace from startup)")
+            if st.button("Start allocation tracing"):
+                monitor.start_tracing()
+            return
+        st.caption(
+            f"Traced: {sample['traced_bytes'] / 2 ** 20:.1f} MB "
+            f"(peak {sample['traced_peak_bytes'] / 2 ** 20:.1f} MB); growth since baseline by site"
+        )
+        st.dataframe(monitor.top_allocations(), hide_index=True, use_container_width=True)
+        col1, col2 = st.columns(2)
+        if col1.button("Reset baseline"):
+            monitor.reset_baseline()
+        if col2.button("Stop tracing"):
+            monitor.stop_tracing()
@@ -1,20 +1,70 @@
 # utils/model_utils.py
 import os
+import io
+import hashlib
+import time
+import asyncio
+import weakref
+import threading
+from collections import OrderedDict
 import streamlit as st
+from PIL import Image
 from langchain_groq import ChatGroq
 import google.generativeai as genai
-from typing import Optional, Dict, Any, List
-from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Callable, Iterator, AsyncIterator, Tuple
+from dataclasses import dataclass, field
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain.memory import ConversationBufferMemory
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 import warnings
 
+from .tracing import span
+from .routing import ModelRouter, AllModelsFailed
+from .async_runtime import run_sync, iterate_sync
+
 warnings.filterwarnings('ignore', category=UserWarning)
 
 warnings.filterwarnings('ignore', message='.*torch.classes.*')
 
+# Conservative characters-per-token estimate used for context budgeting
+CHARS_PER_TOKEN = 3.5
+
+# Tokens kept free in every request for the model's answer
+OUTPUT_TOKEN_RESERVE = 2048
+
+# Share of the context window budgeted, since token counts are estimates
+CONTEXT_SAFETY_FACTOR = 0.8
+
+# Tokens charged for an image sent to a vision model
+IMAGE_TOKENS = 258
+
+REDUCE_PROMPT = """
+    The following are partial analyses of consecutive sections of one document.
+    Merge them into a single, coherent {analysis_type} analysis of the whole
+    document. Remove repetition, keep every distinct finding, and follow the
+    same numbered structure as the partial analyses.
+    
+    {partials}
+"""
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a text without a provider tokenizer
+
+    Non-ASCII characters (CJK and other non-Latin scripts) often take a
+    token each, so they are counted one by one.
+    """
+    non_ascii = len(text) - len(text.encode("ascii", "ignore"))
+    return int((len(text) - non_ascii) / CHARS_PER_TOKEN) + non_ascii + 1
+
+def estimate_content_tokens(content: Dict[str, Any]) -> int:
+    """Estimated tokens of a content dict: its text plus any image"""
+    tokens = estimate_tokens(content.get('text') or '')
+    if content.get('image') is not None:
+        tokens += IMAGE_TOKENS
+    return tokens
+
 @dataclass
 class ModelConfig:
     """Configuration for different models"""
@@ -22,24 +72,45 @@ class ModelConfig:
     provider: str
     temperature: float = 0.7
     supports_vision: bool = False
+    context_window: int = 8192
+    # Longest image side worth sending; larger images are downscaled first
+    max_image_side: Optional[int] = None
+    # Equivalent models to fail over to, in order of preference
+    fallbacks: List[str] = field(default_factory=list)
 
 class ModelManager:
     """Manage Groq and Gemini Pro models"""
     
+    # Encoded image payloads by content hash, shared across reruns and sessions
+    IMAGE_CACHE_SIZE = 32
+    _image_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    _image_cache_lock = threading.Lock()
+    
+    # Groq clients by event loop, so their connection pools are reused
+    _model_cache: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, Any]]" = weakref.WeakKeyDictionary()
+    _model_cache_lock = threading.Lock()
+    
     # Available models configuration
     MODELS = {
         "mixtral-8x7b-32768": ModelConfig(
             name="mixtral-8x7b-32768",
-            provider="groq"
+            provider="groq",
+            context_window=32768,
+            fallbacks=["llama-3.3-70b-versatile", "gemini-pro"]
         ),
         "llama-3.3-70b-versatile": ModelConfig(
             name="llama-3.3-70b-versatile",
-            provider="groq"
+            provider="groq",
+            context_window=131072,
+            fallbacks=["mixtral-8x7b-32768", "gemini-pro"]
         ),
         "gemini-pro": ModelConfig(
             name="gemini-pro",
             provider="google",
-            supports_vision=True
+            supports_vision=True,
+            context_window=30720,
+            max_image_side=1536,
+            fallbacks=["llama-3.3-70b-versatile"]
         )
     }
     
@@ -51,6 +122,10 @@ class ModelManager:
             return_messages=True,
             memory_key="chat_history"
         )
+        # Health and latency tracking is shared by every manager in the process
+        self.router = ModelRouter.shared(
+            {name: config.fallbacks for name, config in self.MODELS.items()}
+        )
     
     def _initialize_clients(self):
         """Initialize Groq and Gemini clients"""
@@ -78,24 +153,35 @@ class ModelManager:
         
         return chain
     
-    def get_model(self, model_name: str) -> Optional[Any]:
-        """Get initialized model by name"""
+    def _build_model(self, model_name: str) -> Any:
+        """Create the client for a model; raises if that is not possible"""
         if model_name not in self.MODELS:
-            st.error(f"Unsupported model: {model_name}")
-            return None
+            raise ValueError(f"Unsupported model: {model_name}")
         
         config = self.MODELS[model_name]
         
+        if config.provider == "groq":
+            llm = ChatGroq(
+                api_key=os.getenv("GROQ_API_KEY"),
+                model_name=model_name,
+                temperature=config.temperature,
+                # Answers stay within the tokens reserved for them in the budget
+                max_tokens=OUTPUT_TOKEN_RESERVE,
+                # Retries are handled by the router, which can also fail over
+                max_retries=0
+            )
+            return self.create_chain(llm)
+        elif config.provider == "google":
+            return self.clients["google"].GenerativeModel(
+                'gemini-pro',
+                generation_config={"max_output_tokens": OUTPUT_TOKEN_RESERVE}
+            )
+        raise ValueError(f"Unknown provider: {config.provider}")
+    
+    def get_model(self, model_name: str) -> Optional[Any]:
+        """Get initialized model by name"""
         try:
-            if config.provider == "groq":
-                llm = ChatGroq(
-                    api_key=os.getenv("GROQ_API_KEY"),
-                    model_name=model_name,
-                    temperature=config.temperature
-                )
-                return self.create_chain(llm)
-            elif config.provider == "google":
-                return self.clients["google"].GenerativeModel('gemini-pro')
+            return self._build_model(model_name)
         except Exception as e:
             st.error(f"Error initializing {model_name}: {str(e)}")
             return None
@@ -108,46 +194,496 @@ class ModelManager:
             return response.text
         return str(response)
     
+    def _usage_tokens(self, response: Any, provider: str) -> Dict[str, int]:
+        """Extract prompt/completion token counts reported by the provider"""
+        if provider == "groq":
+            usage = getattr(response, "usage_metadata", None) or {}
+            return {
+                "input_tokens": usage.get("input_tokens", 0),
+                "output_tokens": usage.get("output_tokens", 0)
+            }
+        elif provider == "google":
+            usage = getattr(response, "usage_metadata", None)
+            return {
+                "input_tokens": getattr(usage, "prompt_token_count", 0),
+                "output_tokens": getattr(usage, "candidates_token_count", 0)
+            }
+        return {}
+    
+    def _prepare_image(self, image: Image.Image, config: ModelConfig) -> Dict[str, Any]:
+        """Downscale and JPEG-encode an image for upload, cached by content hash"""
+        max_side = config.max_image_side
+        source = getattr(image, 'fp', None)
+        if source is not None and hasattr(source, 'getbuffer'):
+            # Hash the uploaded file itself, so cache hits skip decoding entirely
+            key = hashlib.blake2b(source.getbuffer(), digest_size=16)
+        else:
+            key = hashlib.blake2b(image.tobytes(), digest_size=16)
+            key.update(f"{image.size}{image.mode}".encode())
+        key.update(str(max_side).encode())
+        key = key.hexdigest()
+        
+        with self._image_cache_lock:
+            if key in self._image_cache:
+                self._image_cache.move_to_end(key)
+                return self._image_cache[key]
+        
+        if max_side:
+            # For JPEG sources this decodes at reduced scale instead of full size
+            image.draft('RGB', (max_side, max_side))
+        prepared = image
+        if max_side and max(image.size) > max_side:
+            prepared = image.copy()
+            prepared.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        if prepared.mode != 'RGB':
+            prepared = prepared.convert('RGB')
+        
+        buffer = io.BytesIO()
+        prepared.save(buffer, format='JPEG', quality=85, optimize=True)
+        payload = {'mime_type': 'image/jpeg', 'data': buffer.getvalue()}
+        
+        with self._image_cache_lock:
+            self._image_cache[key] = payload
+            while len(self._image_cache) > self.IMAGE_CACHE_SIZE:
+                self._image_cache.popitem(last=False)
+        return payload
+    
+    def _model(self, model_name: str) -> Any:
+        """Model client for the running event loop, reused across requests
+
+        Groq clients hold pooled HTTP connections that belong to one event
+        loop, so they are cached per loop (the shared loop in practice).
+        """
+        if self.MODELS[model_name].provider != "groq":
+            return self._build_model(model_name)
+        
+        key = (model_name, os.getenv("GROQ_API_KEY"), os.getenv("GROQ_API_BASE"))
+        loop = asyncio.get_running_loop()
+        with self._model_cache_lock:
+            models = self._model_cache.setdefault(loop, {})
+            if key not in models:
+                models[key] = self._build_model(model_name)
+            return models[key]
+    
+    async def _ainvoke(self,
+                       model_name: str,
+                       content: Dict[str, Any],
+                       prompt: str,
+                       chat_history: List) -> str:
+        """Send one request to a single model and return its text; raises on failure"""
+        config = self.MODELS[model_name]
+        with span("get_model", model=model_name):
+            model = self._model(model_name)
+        
+        with span("model_call",
+                  model=model_name,
+                  provider=config.provider,
+                  prompt_chars=len(prompt)) as call_span:
+            if config.provider == "groq":
+                response = await model.ainvoke({
+                    "input": prompt,
+                    "chat_history": chat_history
+                })
+            else:
+                # Handle both text and image content for Gemini
+                parts = await self._gemini_parts(content, prompt, config)
+                if isinstance(parts, list):
+                    call_span.set(image_sent_bytes=len(parts[1]['data']))
+                response = await model.generate_content_async(parts)
+            call_span.set(**self._usage_tokens(response, config.provider))
+            return self.process_response(response, config.provider)
+    
+    async def _gemini_parts(self, content: Dict[str, Any], prompt: str, config: ModelConfig) -> Any:
+        """Prompt, plus the prepared image when the model can see it"""
+        if content.get('image') is None or not config.supports_vision:
+            return prompt
+        with span("prepare_image") as image_span:
+            # Decoding and re-encoding is CPU work; keep it off the event loop
+            image_part = await asyncio.to_thread(self._prepare_image, content['image'], config)
+            image_span.set(sent_bytes=len(image_part['data']))
+        return [prompt, image_part]
+    
+    async def _aanalyze(self,
+                        content: Dict[str, Any],
+                        model_name: str,
+                        analysis_type: str,
+                        use_memory: bool,
+                        hedge: Optional[bool]) -> Dict:
+        """Routed analysis shared by the sync and async APIs; raises on failure"""
+        if model_name not in self.MODELS:
+            raise ValueError(f"Unsupported model: {model_name}")
+        
+        # Prepare prompt based on content type and analysis type
+        prompt = self._generate_prompt(content, analysis_type)
+        chat_history = self._fitting_history(content, model_name, analysis_type) if use_memory else []
+        
+        with span("analyze_content", model=model_name, prompt_chars=len(prompt)):
+            analysis, served_by = await self.router.aroute(
+                model_name,
+                lambda name: self._ainvoke(name, content, prompt, chat_history),
+                hedge=hedge
+            )
+        
+        # Save to memory
+        if use_memory and self.MODELS[served_by].provider == "groq":
+            self.memory.save_context(
+                {"input": prompt},
+                {"output": analysis}
+            )
+        return {"analysis": analysis, "model": served_by}
+    
+    async def aanalyze_content(self,
+                               content: Dict[str, Any],
+                               model_name: str,
+                               analysis_type: str = "general",
+                               use_memory: bool = True,
+                               hedge: Optional[bool] = None) -> Optional[Dict]:
+        """Async version of :meth:`analyze_content`"""
+        try:
+            return await self._aanalyze(content, model_name, analysis_type, use_memory, hedge)
+        except Exception as e:
+            st.error(f"Error analyzing with {model_name}: {str(e)}")
+            return None
+    
     def analyze_content(self, 
                        content: Dict[str, Any],
                        model_name: str,
-                       analysis_type: str = "general") -> Optional[Dict]:
-        """Analyze content with specified model and analysis type"""
-        model = self.get_model(model_name)
-        if not model:
+                       analysis_type: str = "general",
+                       use_memory: bool = True,
+                       hedge: Optional[bool] = None) -> Optional[Dict]:
+        """Analyze content with specified model and analysis type
+
+        With ``use_memory=False`` the request is sent without chat history and
+        is not recorded in it, which keeps independent batch items isolated.
+        If the model fails, its configured fallbacks are tried; ``hedge``
+        overrides whether slow requests are raced against a fallback. The
+        result names the model that actually answered.
+
+        Blocks until :meth:`aanalyze_content` finishes on the shared event loop.
+        """
+        try:
+            return run_sync(self._aanalyze(content, model_name, analysis_type, use_memory, hedge))
+        except Exception as e:
+            st.error(f"Error analyzing with {model_name}: {str(e)}")
             return None
+    
+    async def _astream_model(self,
+                             model_name: str,
+                             content: Dict[str, Any],
+                             prompt: str,
+                             chat_history: List,
+                             usage: Dict[str, int]) -> AsyncIterator[str]:
+        """Stream text chunks from a single model; token counts are put in ``usage``"""
+        config = self.MODELS[model_name]
+        model = self._model(model_name)
+        if config.provider == "groq":
+            async for chunk in model.astream({"input": prompt, "chat_history": chat_history}):
+                if chunk.usage_metadata:
+                    # Groq reports usage on the final chunk
+                    usage.update(self._usage_tokens(chunk, config.provider))
+                if chunk.content:
+                    yield chunk.content
+        else:
+            parts = await self._gemini_parts(content, prompt, config)
+            response = await model.generate_content_async(parts, stream=True)
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+            usage.update(self._usage_tokens(response, config.provider))
+    
+    async def astream_content(self,
+                              content: Dict[str, Any],
+                              model_name: str,
+                              analysis_type: str = "general",
+                              use_memory: bool = True,
+                              stats: Optional[Dict[str, Any]] = None,
+                              failover: bool = True) -> AsyncIterator[str]:
+        """Stream an analysis as text chunks
+
+        Fallbacks are tried only until the first chunk arrives; a failure
+        after that is raised. ``stats``, if given, is filled with the model
+        that answered, time to first chunk, total time and token counts.
+        With ``failover=False`` only ``model_name`` is tried.
+        """
+        if model_name not in self.MODELS:
+            raise ValueError(f"Unsupported model: {model_name}")
         
-        # Prepare prompt based on content type and analysis type
         prompt = self._generate_prompt(content, analysis_type)
+        chat_history = self._fitting_history(content, model_name, analysis_type) if use_memory else []
+        stats = {} if stats is None else stats
+        errors = []
         
-        try:
-            config = self.MODELS[model_name]
+        for name in self.router.candidates(model_name) if failover else [model_name]:
+            health = self.router.health_for(name)
+            started = time.perf_counter()
+            parts = []
+            usage = {}
+            try:
+                async for chunk in self._astream_model(name, content, prompt, chat_history, usage):
+                    if not parts:
+                        stats["first_chunk_s"] = time.perf_counter() - started
+                    parts.append(chunk)
+                    yield chunk
+            except Exception as e:
+                health.record_failure()
+                if parts:
+                    raise
+                errors.append(f"{name}: {e}")
+                continue
             
-            if config.provider == "groq":
-                # Use the chain with memory
-                response = model.invoke({
-                    "input": prompt,
-                    "chat_history": self.memory.load_memory_variables({})["chat_history"]
+            health.record_success(time.perf_counter() - started)
+            analysis = "".join(parts)
+            stats.update({
+                "model": name,
+                "total_s": time.perf_counter() - started,
+                "output_chars": len(analysis),
+                "attempts": len(errors) + 1,
+                **usage
+            })
+            if use_memory and self.MODELS[name].provider == "groq":
+                self.memory.save_context({"input": prompt}, {"output": analysis})
+            return
+        
+        raise AllModelsFailed("; ".join(errors))
+    
+    def stream_content(self,
+                       content: Dict[str, Any],
+                       model_name: str,
+                       analysis_type: str = "general",
+                       use_memory: bool = True,
+                       stats: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """Blocking iterator over :meth:`astream_content` (e.g. for ``st.write_stream``)"""
+        return iterate_sync(self.astream_content(content, model_name, analysis_type, use_memory, stats))
+    
+    async def astream_compare(self,
+                              content: Dict[str, Any],
+                              model_names: List[str],
+                              analysis_type: str = "general",
+                              stats: Optional[Dict[str, Dict[str, Any]]] = None) -> AsyncIterator[Tuple[str, str]]:
+        """Stream the same analysis from several models at once
+
+        Yields ``(model_name, chunk)`` in arrival order, so the total wait is
+        the slowest model rather than the sum. There is no failover and no
+        chat memory; ``stats[model_name]`` gets each model's timings, token
+        counts and ``status``/``error``.
+        """
+        stats = {} if stats is None else stats
+        chunks: "asyncio.Queue" = asyncio.Queue()
+        done = object()
+        
+        async def run(name: str):
+            model_stats = stats.setdefault(name, {"model": name})
+            started = time.perf_counter()
+            try:
+                async for chunk in self.astream_content(content, name, analysis_type, use_memory=False,
+                                                        stats=model_stats, failover=False):
+                    await chunks.put((name, chunk))
+                model_stats["status"] = "success"
+            except Exception as e:
+                model_stats.update({
+                    "status": "error",
+                    "error": str(e),
+                    "total_s": time.perf_counter() - started
                 })
-                # Save to memory
-                self.memory.save_context(
-                    {"input": prompt},
-                    {"output": response.content}
+            finally:
+                await chunks.put((name, done))
+        
+        with span("compare", models=len(model_names)):
+            tasks = [asyncio.ensure_future(run(name)) for name in model_names]
+            try:
+                remaining = len(tasks)
+                while remaining:
+                    name, chunk = await chunks.get()
+                    if chunk is done:
+                        remaining -= 1
+                    else:
+                        yield name, chunk
+            finally:
+                for task in tasks:
+                    task.cancel()
+    
+    def stream_compare(self,
+                       content: Dict[str, Any],
+                       model_names: List[str],
+                       analysis_type: str = "general",
+                       stats: Optional[Dict[str, Dict[str, Any]]] = None) -> Iterator[Tuple[str, str]]:
+        """Blocking iterator over :meth:`astream_compare`"""
+        return iterate_sync(self.astream_compare(content, model_names, analysis_type, stats))
+    
+    def input_token_budget(self, model_name: str, analysis_type: str = "general") -> int:
+        """Tokens of content that fit in one request to the model or any fallback"""
+        config = self.MODELS[model_name]
+        # A request may be failed over, so it has to fit the smallest window
+        window = min(
+            [config.context_window] +
+            [self.MODELS[name].context_window for name in config.fallbacks if name in self.MODELS]
+        )
+        template_tokens = estimate_tokens(self._generate_prompt({'text': ''}, analysis_type))
+        return int(window * CONTEXT_SAFETY_FACTOR) - OUTPUT_TOKEN_RESERVE - template_tokens
+    
+    def _fitting_history(self, content: Dict[str, Any], model_name: str, analysis_type: str) -> List:
+        """Newest chat history messages that fit in the request next to the content"""
+        room = self.input_token_budget(model_name, analysis_type) - estimate_content_tokens(content)
+        fitting = []
+        for message in reversed(self.memory.load_memory_variables({})["chat_history"]):
+            room -= estimate_tokens(str(message.content))
+            if room < 0:
+                break
+            fitting.append(message)
+        # Start at a question, not at an answer whose question was dropped
+        while fitting and not isinstance(fitting[-1], HumanMessage):
+            fitting.pop()
+        return fitting[::-1]
+    
+    def needs_map_reduce(self, text: str, model_name: str, analysis_type: str = "general") -> bool:
+        """Whether a text is too large to analyze in a single request"""
+        return estimate_tokens(text) > self.input_token_budget(model_name, analysis_type)
+    
+    async def _aanalyze_stateless(self, prompt: str, model_name: str, hedge: Optional[bool]) -> Tuple[str, str]:
+        """Route one prompt without chat history; returns (analysis, model used) and raises on failure"""
+        return await self.router.aroute(
+            model_name,
+            lambda name: self._ainvoke(name, {'text': prompt}, prompt, []),
+            hedge=hedge
+        )
+    
+    async def _aanalyze_long(self,
+                             content: Dict[str, Any],
+                             model_name: str,
+                             analysis_type: str,
+                             chunk_tokens: int,
+                             max_concurrency: int,
+                             use_memory: bool,
+                             hedge: Optional[bool]) -> Dict:
+        """Map-reduce analysis shared by the sync and async APIs; raises on failure"""
+        if model_name not in self.MODELS:
+            raise ValueError(f"Unsupported model: {model_name}")
+        
+        text = content.get('text', '')
+        budget = self.input_token_budget(model_name, analysis_type)
+        chunk_tokens = min(chunk_tokens, budget)
+        # Chunks are measured in estimated tokens, so non-Latin text is split finer
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_tokens,
+            chunk_overlap=min(200, chunk_tokens // 10),
+            length_function=estimate_tokens
+        )
+        chunks = splitter.split_text(text)
+        limit = asyncio.Semaphore(max_concurrency)
+        
+        async def run_one(prompt: str) -> Tuple[str, str]:
+            async with limit:
+                return await self._aanalyze_stateless(prompt, model_name, hedge)
+        
+        async def run_all(prompts: List[str]) -> Tuple[List[str], List[str]]:
+            answers = await asyncio.gather(*(run_one(prompt) for prompt in prompts))
+            return [analysis for analysis, _ in answers], [served for _, served in answers]
+        
+        with span("analyze_long_content", model=model_name, chunks=len(chunks),
+                  text_chars=len(text)) as long_span:
+            # Map: analyze every chunk with the selected template
+            partials, served_by = await run_all([
+                self._generate_prompt(
+                    {'text': f"[Part {index + 1} of {len(chunks)}]\n{chunk}"},
+                    analysis_type
                 )
-                return {"analysis": response.content}
-            
-            elif config.provider == "google":
-                # Handle both text and image content for Gemini
-                if content.get('image') and config.supports_vision:
-                    response = model.generate_content([prompt, content['image']])
-                else:
-                    response = model.generate_content(prompt)
-                return {"analysis": response.text}
+                for index, chunk in enumerate(chunks)
+            ])
             
+            # Reduce: merge partials in groups that fit the budget, level by level
+            reduce_budget = budget - estimate_tokens(REDUCE_PROMPT)
+            # Partials over half the budget are split (not cut), so every group holds at least two
+            partial_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=reduce_budget // 2 - 64,
+                chunk_overlap=0,
+                length_function=estimate_tokens
+            )
+            rounds, resplit = 0, 0
+            while len(partials) > 1:
+                pieces = []
+                for partial in partials:
+                    if estimate_tokens(partial) > reduce_budget // 2 - 64:
+                        resplit += 1
+                        pieces.extend(partial_splitter.split_text(partial))
+                    else:
+                        pieces.append(partial)
+                groups, group, size = [], [], 0
+                for partial in pieces:
+                    tokens = estimate_tokens(partial)
+                    if group and size + tokens > reduce_budget:
+                        groups.append(group)
+                        group, size = [], 0
+                    group.append(partial)
+                    size += tokens
+                groups.append(group)
+                long_span.set(reduced=True, reduce_rounds=rounds + 1, resplit_partials=resplit)
+                if len(groups) >= len(partials):
+                    # Merged answers are as long as their inputs; another level would not converge
+                    raise RuntimeError(
+                        f"Could not reduce {len(partials)} partial analyses into the {reduce_budget}-token budget"
+                    )
+                
+                partials, served_by = await run_all([
+                    REDUCE_PROMPT.format(
+                        analysis_type=analysis_type,
+                        partials="\n\n".join(
+                            f"--- Section {index + 1} ---\n{partial}"
+                            for index, partial in enumerate(group)
+                        )
+                    )
+                    for group in groups
+                ])
+                rounds += 1
+            long_span.set(reduced=rounds > 0)
+        
+        analysis = partials[0] if partials else ""
+        if use_memory:
+            self.memory.save_context(
+                {"input": f"[Long document analyzed in {len(chunks)} parts]"},
+                {"output": analysis}
+            )
+        # The model that wrote the final answer, which may be a fallback
+        served = served_by[0] if served_by else model_name
+        return {"analysis": analysis, "model": served, "chunks": len(chunks)}
+    
+    async def aanalyze_long_content(self,
+                                    content: Dict[str, Any],
+                                    model_name: str,
+                                    analysis_type: str = "general",
+                                    chunk_tokens: int = 6000,
+                                    max_concurrency: int = 4,
+                                    use_memory: bool = True,
+                                    hedge: Optional[bool] = None) -> Optional[Dict]:
+        """Async version of :meth:`analyze_long_content`"""
+        try:
+            return await self._aanalyze_long(content, model_name, analysis_type, chunk_tokens,
+                                             max_concurrency, use_memory, hedge)
         except Exception as e:
             st.error(f"Error analyzing with {model_name}: {str(e)}")
             return None
+    
+    def analyze_long_content(self,
+                             content: Dict[str, Any],
+                             model_name: str,
+                             analysis_type: str = "general",
+                             chunk_tokens: int = 6000,
+                             max_concurrency: int = 4,
+                             use_memory: bool = True,
+                             hedge: Optional[bool] = None) -> Optional[Dict]:
+        """Map-reduce analysis for text larger than the model context
 
+        The text is split into chunks of at most ``chunk_tokens`` (capped by
+        the model budget), each chunk is analyzed concurrently with the
+        ``analysis_type`` template, and the partial analyses are merged in
+        one or more reduce rounds that each fit the budget.
+        """
+        try:
+            return run_sync(self._aanalyze_long(content, model_name, analysis_type, chunk_tokens,
+                                                max_concurrency, use_memory, hedge))
+        except Exception as e:
+            st.error(f"Error analyzing with {model_name}: {str(e)}")
+            return None
+    
     # Rest of the class remains the same...
     
     def _generate_prompt(self, content: Dict[str, Any], analysis_type: str) -> str:
@@ -209,43 +745,92 @@ class BatchProcessor:
     def __init__(self, model_manager: ModelManager):
         self.model_manager = model_manager
     
+    async def _aprocess_item(self,
+                             idx: int,
+                             content: Dict,
+                             model_name: str,
+                             analysis_type: str,
+                             use_memory: bool) -> Dict:
+        """Analyze one batch item and describe the outcome"""
+        started = time.perf_counter()
+        try:
+            # Analyze content, in parts if it exceeds the model context. The raising
+            # variants are used so the reason for a failure ends up in the result;
+            # st.error would be lost on the event loop thread.
+            if self.model_manager.needs_map_reduce(content.get('text') or '', model_name, analysis_type):
+                analysis = await self.model_manager._aanalyze_long(
+                    content, model_name, analysis_type, chunk_tokens=6000,
+                    max_concurrency=4, use_memory=use_memory, hedge=None
+                )
+            else:
+                analysis = await self.model_manager._aanalyze(
+                    content, model_name, analysis_type, use_memory, None
+                )
+            
+            return {
+                "content_id": content.get('id', f"item_{idx}"),
+                "analysis": analysis,
+                "model": model_name,
+                "served_model": analysis.get('model'),
+                "latency_s": round(time.perf_counter() - started, 4),
+                "status": "success"
+            }
+        except Exception as e:
+            return {
+                "content_id": content.get('id', f"item_{idx}"),
+                "error": str(e),
+                "model": model_name,
+                "latency_s": round(time.perf_counter() - started, 4),
+                "status": "failed"
+            }
+    
+    async def aprocess_batch(self,
+                             contents: List[Dict],
+                             model_name: str,
+                             analysis_type: str = "general",
+                             max_concurrency: int = 8,
+                             on_result: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """Analyze a batch concurrently, without chat memory; results keep input order"""
+        limit = asyncio.Semaphore(max_concurrency)
+        
+        async def run(idx: int, content: Dict) -> Dict:
+            async with limit:
+                result = await self._aprocess_item(idx, content, model_name, analysis_type, False)
+            if on_result:
+                on_result(result)
+            return result
+        
+        return await asyncio.gather(*(run(idx, content) for idx, content in enumerate(contents)))
+    
     def process_batch(self,
                      contents: List[Dict],
                      model_name: str,
-                     analysis_type: str = "general") -> List[Dict]:
-        """Process a batch of content"""
+                     analysis_type: str = "general",
+                     show_ui: bool = True,
+                     use_memory: bool = True,
+                     on_result: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """Process a batch of content; ``on_result`` receives each result as it finishes"""
         results = []
         
         # Create progress indicators
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+        progress_bar = st.progress(0) if show_ui else None
+        status_text = st.empty() if show_ui else None
         
         for idx, content in enumerate(contents):
-            try:
+            if status_text:
                 status_text.text(f"Processing item {idx + 1}/{len(contents)}")
-                
-                # Analyze content
-                analysis = self.model_manager.analyze_content(
-                    content,
-                    model_name,
-                    analysis_type
-                )
-                
-                results.append({
-                    "content_id": content.get('id', f"item_{idx}"),
-                    "analysis": analysis,
-                    "status": "success" if analysis else "failed"
-                })
-                
-                # Update progress
+            
+            results.append(run_sync(
+                self._aprocess_item(idx, content, model_name, analysis_type, use_memory)
+            ))
+            
+            # Update progress
+            if progress_bar:
                 progress_bar.progress((idx + 1) / len(contents))
-                
-            except Exception as e:
-                results.append({
-                    "content_id": content.get('id', f"item_{idx}"),
-                    "error": str(e),
-                    "status": "error"
-                })
+            
+            if on_result:
+                on_result(results[-1])
         
-        status_text.text("Batch processing complete!")
-        return results
\ No newline at end of file
+        if status_text:
+            status_text.text("Batch processing complete!")
+        return results
@@ -0,0 +1,114 @@
+# utils/pipeline.py
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Callable, Tuple
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from .tracing import span
+
+class StagePipeline:
+    """Small dependency-aware pipeline for processing one upload
+
+    Each stage runs on a worker thread as soon as the stages it depends on
+    have finished, and is called with their results in order. A stage whose
+    dependency returned None or failed is skipped. Worker threads carry the
+    active trace and the Streamlit script context, so stages may render into
+    containers created beforehand by the caller.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self.stages: Dict[str, Tuple[Callable[..., Any], Tuple[str, ...]]] = {}
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, BaseException] = {}
+        self.skipped: List[str] = []
+        # Per stage: start and end offsets from the pipeline start, and duration, in seconds
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self.wall_s = 0.0
+
+    def add(self, name: str, func: Callable[..., Any], after: Tuple[str, ...] = ()) -> "StagePipeline":
+        for dependency in after:
+            if dependency not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dependency}")
+        self.stages[name] = (func, tuple(after))
+        return self
+
+    def _run_stage(self, name: str, func: Callable[..., Any], args: List[Any], script_ctx, started: float) -> Any:
+        if script_ctx is not None:
+            add_script_run_ctx(threading.current_thread(), script_ctx)
+        stage_started = time.perf_counter()
+        try:
+            with span(f"pipeline.{name}"):
+                return func(*args)
+        finally:
+            stage_ended = time.perf_counter()
+            self.timings[name] = {
+                "start_s": stage_started - started,
+                "end_s": stage_ended - started,
+                "duration_s": stage_ended - stage_started
+            }
+
+    def run(self) -> Dict[str, Any]:
+        """Run every stage; returns results by stage name
+
+        The first exception raised by a stage is re-raised once the stages
+        already running have finished.
+        """
+        script_ctx = get_script_run_ctx(suppress_warning=True)
+        started = time.perf_counter()
+        pending = dict(self.stages)
+        running = {}
+        finished = set()
+
+        with ThreadPoolExecutor(self.max_workers, thread_name_prefix="stage") as pool:
+            while pending or running:
+                for name, (func, after) in list(pending.items()):
+                    if not finished.issuperset(after):
+                        continue
+                    del pending[name]
+                    if any(self.results.get(dependency) is None for dependency in after):
+                        self.skipped.append(name)
+                        finished.add(name)
+                        continue
+                    # Carry the active trace into the worker thread
+                    context = contextvars.copy_context()
+                    future = pool.submit(
+                        context.run, self._run_stage, name, func,
+                        [self.results[dependency] for dependency in after], script_ctx, started
+                    )
+                    running[future] = name
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    finished.add(name)
+                    try:
+                        self.results[name] = future.result()
+                    except Exception as e:
+                        self.errors[name] = e
+
+        self.wall_s = time.perf_counter() - started
+        if self.errors:
+            raise next(iter(self.errors.values()))
+        return self.results
+
+    def sequential_s(self) -> float:
+        """What the stages would have taken run one after another"""
+        return sum(timing["duration_s"] for timing in self.timings.values())
+
+    def timing_rows(self) -> List[Dict[str, Any]]:
+        """Stage timings in start order, for display"""
+        return [
+            {
+                "stage": name,
+                "start_s": round(timing["start_s"], 3),
+                "duration_s": round(timing["duration_s"], 3),
+                "end_s": round(timing["end_s"], 3)
+            }
+            for name, timing in sorted(self.timings.items(), key=lambda item: item[1]["start_s"])
+        ]
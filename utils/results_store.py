@@ -0,0 +1,299 @@
+# utils/results_store.py
+import os
+import json
+import threading
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+RESULTS_DIR = os.getenv("RESULTS_DIR", ".results")
+
+RESULT_SCHEMA = pa.schema([
+    ("content_id", pa.string()),
+    ("filename", pa.string()),
+    ("file_type", pa.string()),
+    ("status", pa.string()),
+    ("error", pa.string()),
+    ("model", pa.string()),
+    ("served_model", pa.string()),
+    ("analysis_type", pa.string()),
+    ("enhancement_type", pa.string()),
+    ("confidence", pa.float64()),
+    ("word_count", pa.int64()),
+    ("ocr_s", pa.float64()),
+    ("analyze_s", pa.float64()),
+    ("total_s", pa.float64()),
+    ("stats", pa.string()),
+    ("analysis", pa.string()),
+    ("created_at", pa.timestamp("ms"))
+])
+
+COMPARE_SCHEMA = pa.schema([
+    ("compare_id", pa.string()),
+    ("model", pa.string()),
+    ("status", pa.string()),
+    ("error", pa.string()),
+    ("analysis_type", pa.string()),
+    ("content_chars", pa.int64()),
+    ("first_chunk_s", pa.float64()),
+    ("total_s", pa.float64()),
+    ("input_tokens", pa.int64()),
+    ("output_tokens", pa.int64()),
+    ("output_chars", pa.int64()),
+    ("created_at", pa.timestamp("ms"))
+])
+
+# Columns shown in tables; the analysis text is only loaded on demand
+SUMMARY_COLUMNS = [name for name in RESULT_SCHEMA.names if name not in ("analysis", "stats")]
+
+def new_results_path(prefix: str = "batch") -> str:
+    """Timestamped Parquet path in the results directory"""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    return os.path.join(RESULTS_DIR, f"{prefix}_{datetime.now():%Y%m%d_%H%M%S_%f}.parquet")
+
+class BatchResultWriter:
+    """Append batch results to a Parquet file, one row group per flush"""
+
+    def __init__(self, path: str, flush_rows: int = 256):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.rows_written = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._writer = pq.ParquetWriter(path, RESULT_SCHEMA, compression="zstd")
+
+    @staticmethod
+    def _to_row(record: Dict[str, Any]) -> Dict[str, Any]:
+        stats = record.get("stats") or {}
+        analysis = record.get("analysis")
+        if isinstance(analysis, dict):
+            analysis = analysis.get("analysis")
+        row = {name: record.get(name) for name in RESULT_SCHEMA.names}
+        row.update({
+            "confidence": record.get("confidence", stats.get("confidence")),
+            "word_count": record.get("word_count", stats.get("word_count")),
+            "enhancement_type": record.get("enhancement_type", stats.get("enhancement_type")),
+            "stats": json.dumps(stats, default=str) if stats else None,
+            "analysis": analysis,
+            "created_at": record.get("created_at") or datetime.now()
+        })
+        return row
+
+    def write(self, record: Dict[str, Any]):
+        """Buffer one result; rows are flushed to disk every ``flush_rows``"""
+        with self._lock:
+            self._buffer.append(self._to_row(record))
+            if len(self._buffer) >= self.flush_rows:
+                self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        self._writer.write_table(pa.Table.from_pylist(self._buffer, schema=RESULT_SCHEMA))
+        self.rows_written += len(self._buffer)
+        self._buffer = []
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ResultDatasetWriter:
+    """Append batch results to a directory of Parquet part files, one per flush
+
+    Each part is written under a hidden name and renamed when complete, so
+    a run killed at any point leaves a readable dataset that only lacks
+    the rows still buffered. Every run adds its own parts.
+    """
+
+    def __init__(self, directory: str, flush_rows: int = 32):
+        self.directory = directory
+        self.flush_rows = flush_rows
+        self.rows_written = 0
+        self.run_id = f"{datetime.now():%Y%m%d_%H%M%S_%f}"
+        self._parts = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, record: Dict[str, Any]):
+        """Buffer one result; a part file is written every ``flush_rows``"""
+        with self._lock:
+            self._buffer.append(BatchResultWriter._to_row(record))
+            if len(self._buffer) >= self.flush_rows:
+                self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        name = f"part-{self.run_id}-{self._parts:05d}.parquet"
+        # Dataset readers skip files starting with "."
+        temp_path = os.path.join(self.directory, f".{name}.tmp")
+        pq.write_table(pa.Table.from_pylist(self._buffer, schema=RESULT_SCHEMA), temp_path,
+                       compression="zstd")
+        os.replace(temp_path, os.path.join(self.directory, name))
+        self._parts += 1
+        self.rows_written += len(self._buffer)
+        self._buffer = []
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def dataset_parts(directory: str) -> List[str]:
+    """Complete part files of a results dataset directory"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.endswith(".parquet") and not name.startswith((".", "_"))
+    )
+
+def read_dataset(directory: str, columns: Optional[List[str]] = None) -> pa.Table:
+    """All rows of a results dataset directory"""
+    if not dataset_parts(directory):
+        return RESULT_SCHEMA.empty_table().select(columns or RESULT_SCHEMA.names)
+    return pq.ParquetDataset(directory, schema=RESULT_SCHEMA).read(columns=columns)
+
+def count_rows(path: str) -> int:
+    """Row count from the Parquet footer, without reading any data"""
+    return pq.ParquetFile(path).metadata.num_rows
+
+def read_page(path: str,
+              page: int,
+              page_size: int = 50,
+              columns: Optional[List[str]] = None) -> pa.Table:
+    """Read one page of results, touching only the row groups it spans"""
+    parquet_file = pq.ParquetFile(path)
+    start = page * page_size
+    end = start + page_size
+
+    row_groups, first_row, offset = [], None, 0
+    for index in range(parquet_file.num_row_groups):
+        rows = parquet_file.metadata.row_group(index).num_rows
+        if offset + rows > start and offset < end:
+            if first_row is None:
+                first_row = offset
+            row_groups.append(index)
+        offset += rows
+
+    if not row_groups:
+        return RESULT_SCHEMA.empty_table().select(columns or RESULT_SCHEMA.names)
+    table = parquet_file.read_row_groups(row_groups, columns=columns)
+    return table.slice(start - first_row, page_size)
+
+def read_row(path: str, row: int) -> Dict[str, Any]:
+    """Read a single full result, including its analysis text"""
+    table = read_page(path, row, page_size=1)
+    return table.to_pylist()[0] if table.num_rows else {}
+
+def confidence_distribution(path: str, bin_width: int = 10) -> Dict[str, int]:
+    """Histogram of OCR confidence in ``bin_width``-point bins"""
+    confidence = pq.read_table(path, columns=["confidence"])["confidence"].drop_null()
+    if len(confidence) == 0:
+        return {}
+    bins = pc.multiply(pc.floor(pc.divide(confidence, float(bin_width))), float(bin_width))
+    counts = pc.value_counts(pc.cast(bins, pa.int64()))
+    return {
+        f"{int(item['values'])}-{int(item['values']) + bin_width}": int(item['counts'])
+        for item in sorted(counts.to_pylist(), key=lambda item: item['values'])
+    }
+
+def failures_per_model(path: str) -> List[Dict[str, Any]]:
+    """Count of non-successful results per requested model and status"""
+    table = pq.read_table(path, columns=["model", "status"])
+    failed = table.filter(pc.not_equal(table["status"], "success"))
+    if failed.num_rows == 0:
+        return []
+    grouped = failed.group_by(["model", "status"]).aggregate([("status", "count")])
+    return sorted(grouped.to_pylist(), key=lambda row: -row["status_count"])
+
+def summarize(path: str) -> Dict[str, Any]:
+    """Overall counts and latency/confidence aggregates for a results file"""
+    table = pq.read_table(path, columns=["status", "confidence", "ocr_s", "analyze_s", "total_s"])
+    summary = {
+        "rows": table.num_rows,
+        "succeeded": pc.sum(pc.equal(table["status"], "success")).as_py() or 0
+    }
+    for column in ("confidence", "ocr_s", "analyze_s", "total_s"):
+        values = table[column].drop_null()
+        if len(values):
+            summary[f"{column}_mean"] = round(pc.mean(values).as_py(), 3)
+            summary[f"{column}_p95"] = round(pc.quantile(values, q=0.95)[0].as_py(), 3)
+    return summary
+
+def compare_dir() -> str:
+    return os.path.join(RESULTS_DIR, "compare")
+
+def write_comparison(stats: Dict[str, Dict[str, Any]],
+                     analysis_type: str,
+                     content_chars: int) -> str:
+    """Store the per-model numbers of one comparison run as its own Parquet file"""
+    os.makedirs(compare_dir(), exist_ok=True)
+    created_at = datetime.now()
+    compare_id = f"compare_{created_at:%Y%m%d_%H%M%S_%f}"
+    rows = [
+        {
+            **{name: model_stats.get(name) for name in COMPARE_SCHEMA.names},
+            "compare_id": compare_id,
+            "analysis_type": analysis_type,
+            "content_chars": content_chars,
+            "created_at": created_at
+        }
+        for model_stats in stats.values()
+    ]
+    path = os.path.join(compare_dir(), f"{compare_id}.parquet")
+    pq.write_table(pa.Table.from_pylist(rows, schema=COMPARE_SCHEMA), path)
+    return path
+
+def comparison_summary(directory: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Per-model runs, failure rate, latency and token averages over all comparisons"""
+    directory = directory or compare_dir()
+    if not os.path.isdir(directory) or not os.listdir(directory):
+        return []
+    table = ds.dataset(directory, format="parquet", schema=COMPARE_SCHEMA).to_table()
+    table = table.append_column("failed", pc.cast(pc.not_equal(table["status"], "success"), pa.int64()))
+    grouped = table.group_by("model").aggregate([
+        ("compare_id", "count"),
+        ("failed", "sum"),
+        ("first_chunk_s", "mean"),
+        ("total_s", "mean"),
+        ("total_s", "tdigest", pc.TDigestOptions(q=0.95)),
+        ("output_tokens", "mean")
+    ])
+    summary = []
+    for row in grouped.to_pylist():
+        p95 = row["total_s_tdigest"][0] if row["total_s_tdigest"] else None
+        summary.append({
+            "model": row["model"],
+            "runs": row["compare_id_count"],
+            "failure_rate": round(row["failed_sum"] / row["compare_id_count"], 3),
+            "first_chunk_s": round(row["first_chunk_s_mean"], 3) if row["first_chunk_s_mean"] is not None else None,
+            "mean_s": round(row["total_s_mean"], 3) if row["total_s_mean"] is not None else None,
+            "p95_s": round(p95, 3) if p95 is not None else None,
+            "output_tokens": round(row["output_tokens_mean"]) if row["output_tokens_mean"] is not None else None
+        })
+    return sorted(summary, key=lambda row: (row["failure_rate"], row["mean_s"] or float("inf")))
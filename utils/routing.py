@@ -0,0 +1,171 @@
+# utils/routing.py
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Optional, Dict, Any, List, Callable, Tuple, Awaitable
+
+from .tracing import span
+
+class ModelHealth:
+    """Rolling latency and failure tracker for one model"""
+
+    def __init__(self, window: int = 50, failure_threshold: int = 3, cooldown: float = 30.0):
+        self.latencies = deque(maxlen=window)
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.latencies.append(latency)
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.open_until = 0.0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                # Stop routing to this model for a while
+                self.open_until = time.monotonic() + self.cooldown
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.open_until
+
+    def p95(self) -> Optional[float]:
+        """95th percentile latency, once enough samples exist to trust it"""
+        with self._lock:
+            if len(self.latencies) < 5:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        total = self.successes + self.failures
+        return {
+            "available": self.available,
+            "requests": total,
+            "error_rate": round(self.failures / total, 3) if total else 0.0,
+            "p95_s": round(p95, 3) if p95 is not None else None
+        }
+
+class AllModelsFailed(Exception):
+    """Raised when the requested model and all of its fallbacks failed"""
+
+class ModelRouter:
+    """Failover and optional hedging across equivalent models
+
+    ``call(model_name)`` performs one request and raises on failure. Models
+    are tried in the order ``[model_name] + fallbacks``, skipping models whose
+    circuit is open. With hedging, a second model is started when the first
+    has not answered within its observed p95 latency, and the first
+    successful answer wins.
+    """
+
+    _shared: Optional["ModelRouter"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self,
+                 fallbacks: Dict[str, List[str]],
+                 hedge: bool = False):
+        self.fallbacks = fallbacks
+        self.hedge = hedge
+        self.health: Dict[str, ModelHealth] = {}
+        self._health_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, fallbacks: Dict[str, List[str]]) -> "ModelRouter":
+        """Process-wide router, so health survives Streamlit reruns and sessions"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(fallbacks, hedge=os.getenv("HEDGE_REQUESTS", "0") == "1")
+            return cls._shared
+
+    def health_for(self, model_name: str) -> ModelHealth:
+        with self._health_lock:
+            return self.health.setdefault(model_name, ModelHealth())
+
+    def candidates(self, model_name: str) -> List[str]:
+        """Requested model first, then healthy fallbacks"""
+        ordered = [model_name] + [
+            fallback for fallback in self.fallbacks.get(model_name, []) if fallback != model_name
+        ]
+        healthy = [name for name in ordered if self.health_for(name).available]
+        # If every circuit is open, still try rather than fail outright
+        candidates = healthy or ordered
+        # A model without fallbacks gets one retry
+        return candidates if len(candidates) > 1 else candidates * 2
+
+    async def _atimed_call(self, call: Callable[[str], Awaitable[Any]], model_name: str) -> Any:
+        started = time.perf_counter()
+        try:
+            with span("route.attempt", model=model_name):
+                result = await call(model_name)
+        except Exception:
+            self.health_for(model_name).record_failure()
+            raise
+        self.health_for(model_name).record_success(time.perf_counter() - started)
+        return result
+
+    async def aroute(self,
+                     model_name: str,
+                     call: Callable[[str], Awaitable[Any]],
+                     hedge: Optional[bool] = None) -> Tuple[Any, str]:
+        """Await ``call`` against the model or its fallbacks; return (result, model used)
+
+        ``call`` returns a coroutine for a model name; the losing hedge is cancelled.
+        """
+        hedge = self.hedge if hedge is None else hedge
+        candidates = self.candidates(model_name)
+        errors = []
+
+        with span("route", model=model_name, hedge=hedge) as route_span:
+            index = 0
+            while index < len(candidates):
+                primary = candidates[index]
+                secondary = candidates[index + 1] if index + 1 < len(candidates) else None
+                tasks = {asyncio.ensure_future(self._atimed_call(call, primary)): primary}
+
+                hedge_after = self.health_for(primary).p95() if hedge and secondary else None
+                if hedge_after is not None:
+                    done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+                    if not done:
+                        # Primary is slower than usual: race the next model
+                        tasks[asyncio.ensure_future(self._atimed_call(call, secondary))] = secondary
+                        route_span.set(hedged=True)
+                        index += 1
+
+                pending = set(tasks)
+                try:
+                    while pending:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            try:
+                                result = task.result()
+                            except Exception as e:
+                                errors.append(f"{tasks[task]}: {e}")
+                                continue
+                            route_span.set(served_by=tasks[task], attempts=len(errors) + 1)
+                            return result, tasks[task]
+                finally:
+                    for task in pending:
+                        task.cancel()
+                index += 1
+
+            route_span.set(attempts=len(errors))
+            raise AllModelsFailed("; ".join(errors))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Health summary of every model seen so far"""
+        with self._health_lock:
+            names = list(self.health)
+        return {name: self.health_for(name).snapshot() for name in names}
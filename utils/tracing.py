@@ -0,0 +1,241 @@
+# utils/tracing.py
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, Dict, Any, List
+
+import streamlit as st
+
+# Histogram buckets for span latency, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Numeric span attributes with these suffixes are also exported as counters
+COUNTED_SUFFIXES = ("_bytes", "_tokens", "_chars", "_pages")
+
+logger = logging.getLogger("chatbot.trace")
+
+@dataclass
+class Span:
+    """A timed operation inside a trace"""
+    name: str
+    started: float
+    duration: float = 0.0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    depth: int = 0
+
+    def set(self, **attributes):
+        """Attach attributes such as payload sizes or token counts"""
+        self.attributes.update(attributes)
+
+@dataclass
+class Trace:
+    """All spans recorded while handling one user request"""
+    name: str
+    started: float = field(default_factory=time.time)
+    duration: float = 0.0
+    spans: List[Span] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace": self.name,
+            "started": self.started,
+            "duration_s": round(self.duration, 6),
+            "spans": [
+                {
+                    "name": span.name,
+                    "offset_s": round(span.started - self.started, 6),
+                    "duration_s": round(span.duration, 6),
+                    "depth": span.depth,
+                    "error": span.error,
+                    **span.attributes
+                }
+                for span in sorted(self.spans, key=lambda span: span.started)
+            ]
+        }
+
+class MetricsRegistry:
+    """Process-wide latency histograms and attribute counters per span name"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency: Dict[str, Dict[str, Any]] = {}
+        self._counters: Dict[tuple, float] = {}
+        self._errors: Dict[str, int] = {}
+        self._gauges: Dict[str, tuple] = {}
+
+    def set_gauge(self, name: str, value: float, description: str = ""):
+        """Record the current value of a process-level measurement such as memory use"""
+        with self._lock:
+            self._gauges[name] = (value, description)
+
+    def observe(self, span: Span):
+        with self._lock:
+            histogram = self._latency.setdefault(
+                span.name, {"count": 0, "sum": 0.0, "buckets": [0] * len(LATENCY_BUCKETS)}
+            )
+            histogram["count"] += 1
+            histogram["sum"] += span.duration
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if span.duration <= bound:
+                    histogram["buckets"][index] += 1
+
+            if span.error:
+                self._errors[span.name] = self._errors.get(span.name, 0) + 1
+
+            for key, value in span.attributes.items():
+                if key.endswith(COUNTED_SUFFIXES) and isinstance(value, (int, float)):
+                    self._counters[(span.name, key)] = self._counters.get((span.name, key), 0) + value
+
+    def export_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = [
+            "# HELP chatbot_span_duration_seconds Latency of instrumented operations",
+            "# TYPE chatbot_span_duration_seconds histogram"
+        ]
+        with self._lock:
+            for name, histogram in sorted(self._latency.items()):
+                for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+                    lines.append(f'chatbot_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+                lines.append(f'chatbot_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {histogram["count"]}')
+                lines.append(f'chatbot_span_duration_seconds_sum{{span="{name}"}} {histogram["sum"]:.6f}')
+                lines.append(f'chatbot_span_duration_seconds_count{{span="{name}"}} {histogram["count"]}')
+
+            lines.append("# HELP chatbot_span_errors_total Failed instrumented operations")
+            lines.append("# TYPE chatbot_span_errors_total counter")
+            for name, count in sorted(self._errors.items()):
+                lines.append(f'chatbot_span_errors_total{{span="{name}"}} {count}')
+
+            lines.append("# HELP chatbot_span_attribute_total Summed sizes and token counts")
+            lines.append("# TYPE chatbot_span_attribute_total counter")
+            for (name, key), value in sorted(self._counters.items()):
+                lines.append(f'chatbot_span_attribute_total{{span="{name}",attribute="{key}"}} {value}')
+
+            for name, (value, description) in sorted(self._gauges.items()):
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+_current_depth: contextvars.ContextVar[int] = contextvars.ContextVar("current_depth", default=0)
+
+def current_trace() -> Optional[Trace]:
+    """The trace active in this context, if any"""
+    return _current_trace.get()
+
+@contextmanager
+def trace(name: str):
+    """Start a trace for one user request; spans inside are attached to it"""
+    active = Trace(name)
+    token = _current_trace.set(active)
+    started = time.perf_counter()
+    try:
+        yield active
+    finally:
+        active.duration = time.perf_counter() - started
+        _current_trace.reset(token)
+        _log_trace(active)
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time an operation and record it in the active trace and the metrics"""
+    depth = _current_depth.get()
+    current = Span(name, started=time.time(), attributes=dict(attributes), depth=depth)
+    depth_token = _current_depth.set(depth + 1)
+    started = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.error = str(e)
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        _current_depth.reset(depth_token)
+        metrics.observe(current)
+        active = _current_trace.get()
+        if active is not None:
+            active.add(current)
+
+def _log_trace(active: Trace):
+    """Export a finished trace to TRACE_LOG_FILE / METRICS_FILE, when configured"""
+    try:
+        if os.getenv("TRACE_LOG_FILE"):
+            with open(os.getenv("TRACE_LOG_FILE"), "a", encoding="utf-8") as log_file:
+                log_file.write(json.dumps(active.to_dict(), default=str) + "\n")
+        if os.getenv("METRICS_FILE"):
+            write_prometheus(os.getenv("METRICS_FILE"))
+    except OSError as e:
+        logger.warning("Could not export trace: %s", e)
+
+def write_prometheus(path: str):
+    """Write the current metrics to a file (for node_exporter's textfile collector)
+
+    The file is written next to ``path`` and renamed over it, so the
+    collector never reads a half-written file.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(metrics.export_prometheus())
+        # mkstemp creates the file owner-only; the collector may run as another user
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = metrics.export_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics for Prometheus scraping from a background thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def render_debug_panel(last_trace: Optional[Trace]):
+    """Show the latency breakdown of the last request in the sidebar"""
+    with st.expander("Debug: last request breakdown"):
+        if last_trace is None:
+            st.caption("No request traced yet")
+            return
+        st.caption(f"{last_trace.name}: {last_trace.duration * 1000:.0f} ms total")
+        rows = []
+        for recorded in last_trace.to_dict()["spans"]:
+            rows.append({
+                "span": "  " * recorded.pop("depth") + recorded.pop("name"),
+                "ms": round(recorded.pop("duration_s") * 1000, 1),
+                "start ms": round(recorded.pop("offset_s") * 1000, 1),
+                "details": ", ".join(f"{key}={value}" for key, value in recorded.items() if value is not None)
+            })
+        st.dataframe(rows, hide_index=True, use_container_width=True)
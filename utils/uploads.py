@@ -0,0 +1,193 @@
+# utils/uploads.py
+import os
+import io
+import mmap
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, BinaryIO
+
+from PIL import Image
+
+# Size of each read/write when spooling an upload to disk
+CHUNK_SIZE = 1024 * 1024
+
+# Largest single upload accepted (Streamlit's own default limit is 200 MB)
+MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_MB", "200")) * 1024 * 1024
+
+# Upload bytes this process works on at once; further uploads wait for room
+PROCESS_BUDGET_BYTES = int(os.getenv("UPLOAD_PROCESS_BUDGET_MB", "512")) * 1024 * 1024
+
+# How long an upload waits for budget before giving up
+BUDGET_TIMEOUT = float(os.getenv("UPLOAD_BUDGET_TIMEOUT", "120"))
+
+# 8-bit grayscale frames alive at once while an image is OCR'd: the decoded page,
+# the enhancement intermediates and the copy handed to Tesseract
+IMAGE_WORKING_FRAMES = 5
+
+SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "chatbot-uploads"))
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds the per-file limit"""
+
+class UploadBudgetExceeded(RuntimeError):
+    """Raised when no upload budget became free within the timeout"""
+
+class ByteBudget:
+    """Counting limit on bytes in flight; acquiring blocks until enough is released"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, nbytes: int, timeout: Optional[float] = None):
+        if nbytes > self.limit:
+            raise UploadTooLarge(
+                f"Upload of {nbytes / 2 ** 20:.1f} MB exceeds the process budget of {self.limit / 2 ** 20:.0f} MB"
+            )
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.in_use + nbytes <= self.limit, timeout):
+                raise UploadBudgetExceeded("Server is busy with other uploads; please try again shortly")
+            self.in_use += nbytes
+
+    def release(self, nbytes: int):
+        with self._condition:
+            self.in_use -= nbytes
+            self._condition.notify_all()
+
+process_budget = ByteBudget(PROCESS_BUDGET_BYTES)
+
+def _is_path(source: Any) -> bool:
+    return isinstance(source, (str, os.PathLike))
+
+def upload_size(source: Any) -> int:
+    """Size in bytes of a path, upload or file-like object, without reading it"""
+    if _is_path(source):
+        return os.path.getsize(source)
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    if hasattr(source, 'nbytes'):
+        # Arrays and memoryviews
+        return source.nbytes
+    if isinstance(getattr(source, 'size', None), int):
+        # Streamlit UploadedFile
+        return source.size
+    if hasattr(source, 'getbuffer'):
+        return source.getbuffer().nbytes
+    if isinstance(source, Image.Image):
+        # Already decoded; its seek() selects frames, not byte offsets
+        return 0
+    if hasattr(source, 'seek'):
+        position = source.tell()
+        size = source.seek(0, io.SEEK_END)
+        source.seek(position)
+        return size
+    return 0
+
+def image_working_bytes(source: Any, frames: int = IMAGE_WORKING_FRAMES) -> int:
+    """Peak memory of OCR'ing an image: the upload plus its decoded frames
+
+    Dimensions come from the image header, so nothing is decoded here.
+    """
+    if hasattr(source, 'shape'):
+        height, width = source.shape[:2]
+    elif isinstance(source, Image.Image):
+        width, height = source.size
+    else:
+        try:
+            header = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+            with Image.open(header) as image:
+                width, height = image.size
+        except Exception:
+            # Not an image we can read; decoding will report the error
+            return upload_size(source)
+        finally:
+            if hasattr(source, 'seek'):
+                source.seek(0)
+    return upload_size(source) + width * height * frames
+
+@contextmanager
+def reserve(source: Any,
+            max_file_bytes: Optional[int] = None,
+            budget: Optional[ByteBudget] = None,
+            timeout: Optional[float] = None,
+            nbytes: Optional[int] = None) -> Iterator[int]:
+    """Hold budget for an upload while it is processed; yields the bytes held
+
+    The file size is checked against the per-file limit. ``nbytes`` is what
+    processing it keeps in memory, when that is more than the file itself.
+    """
+    size = upload_size(source)
+    max_file_bytes = MAX_FILE_BYTES if max_file_bytes is None else max_file_bytes
+    if size > max_file_bytes:
+        raise UploadTooLarge(
+            f"File is {size / 2 ** 20:.1f} MB; the limit is {max_file_bytes / 2 ** 20:.0f} MB"
+        )
+    held = max(size, nbytes or 0)
+    budget = budget or process_budget
+    budget.acquire(held, BUDGET_TIMEOUT if timeout is None else timeout)
+    try:
+        yield held
+    finally:
+        budget.release(held)
+
+def copy_upload(source: Any, target: BinaryIO) -> int:
+    """Write an upload to an open file in fixed-size chunks; returns bytes written"""
+    written = 0
+    if hasattr(source, 'getbuffer'):
+        # Slices of a memoryview are views, so no chunk is copied in memory
+        view = source.getbuffer()
+        for start in range(0, view.nbytes, CHUNK_SIZE):
+            written += target.write(view[start:start + CHUNK_SIZE])
+        return written
+
+    source.seek(0)
+    while chunk := source.read(CHUNK_SIZE):
+        written += target.write(chunk)
+    return written
+
+@contextmanager
+def spooled_path(source: Any, suffix: str = "") -> Iterator[str]:
+    """A file path for an upload, for readers that need one
+
+    Paths are used as they are. Anything else is written to a temporary
+    file in chunks, which is always deleted afterwards.
+    """
+    with reserve(source):
+        if _is_path(source):
+            yield os.fspath(source)
+            return
+
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=SPOOL_DIR, suffix=suffix, delete=False) as spool:
+            path = spool.name
+        try:
+            with open(path, "wb") as spool:
+                copy_upload(source, spool)
+            yield path
+        finally:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+@contextmanager
+def open_readable(source: Any) -> Iterator[Any]:
+    """A seekable binary reader for an upload, without loading files into memory
+
+    Files are memory-mapped, so pages are read from the OS cache on demand;
+    in-memory uploads are used directly.
+    """
+    if _is_path(source) or not hasattr(source, 'getbuffer'):
+        with spooled_path(source) as path, open(path, "rb") as handle:
+            if os.fstat(handle.fileno()).st_size == 0:
+                yield io.BytesIO()
+                return
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+        return
+
+    with reserve(source):
+        source.seek(0)
+        yield source
@@ -0,0 +1,39 @@
+# worker.py
+import sys
+import argparse
+import warnings
+
+from dotenv import load_dotenv
+
+warnings.filterwarnings('ignore', category=UserWarning)
+
+from utils.job_queue import DEFAULT_DB_PATH, JobQueue, run_worker, start_workers
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run background job workers for the chatbot")
+    parser.add_argument("--workers", type=int, default=2, help="Number of worker processes")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Path to the SQLite job database")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    load_dotenv()
+
+    # Recover jobs left running by workers that were killed
+    JobQueue(args.db).requeue_stale()
+
+    if args.workers == 1:
+        run_worker(args.db)
+        return 0
+
+    print(f"Starting {args.workers} workers on {args.db}")
+    workers = start_workers(args.workers, args.db)
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        print("Stopping workers...")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())